@@ -33,7 +33,10 @@ var mix = {
                 text: this.review.text,
                 rate: this.review.rate
             }).then(({data}) => {
-                this.product.reviews = data
+                // The response holds only the new review, the product keeps the ones already shown
+                this.product.reviews = [data.review, ...(this.product.reviews || [])]
+                this.product.reviewsCount = data.reviewsCount
+                this.product.rating = data.rating
                 alert('Отзыв опубликован')
                 this.review.author = ''
                 this.review.email = ''
@@ -43,6 +46,19 @@ var mix = {
                 console.warn('Ошибка при публикации отзыва')
             })
         },
+        loadMoreReviews () {
+            // The product comes with its latest reviews only, the rest is paged from the start of the list
+            const params = this.reviewsCursor ? { cursor: this.reviewsCursor } : {}
+            this.getData(`/api/product/${this.product.id}/reviews/`, params).then(data => {
+                this.product.reviews = this.reviewsCursor
+                    ? [...this.product.reviews, ...data.items]
+                    : data.items
+                this.product.reviewsCount = data.count
+                this.reviewsCursor = data.nextCursor
+            }).catch(() => {
+                console.warn('Ошибка при получении отзывов')
+            })
+        },
         setActivePhoto(index) {
             this.activePhoto = index
         }
@@ -55,6 +71,7 @@ var mix = {
             product : {},
             activePhoto: 0,
             count: 1,
+            reviewsCursor: null,
             review: {
                 author: '',
                 email: '',
@@ -1,8 +1,10 @@
 from django.contrib.admin.widgets import FilteredSelectMultiple
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from .models import (Image, Category, Subcategory, Product, Sale, Review, Specification, OrderProduct,
-                     Order, Basket, Tag, OrderHistory)
+                     Order, Basket, Tag, OrderHistory, Banner)
 from django.contrib import admin
+from .sales import apply_sales
 
 admin.site.site_header = _("Administrative  panel of Megano")
 admin.site.site_title = _("Megano panel")
@@ -54,6 +56,11 @@ class SaleAdmin(admin.ModelAdmin):
             ]
         return fieldsets
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Sales starting today should not wait for the next scheduled run
+        transaction.on_commit(apply_sales)
+
     def cancel_the_sale(self, request, queryset):
         for sale in queryset:
             if sale.is_active:
@@ -63,6 +70,18 @@ class SaleAdmin(admin.ModelAdmin):
             sale.delete()
 
 
+class SpecificationInline(admin.TabularInline):
+    model = Specification
+    extra = 0
+
+
+class ReviewInline(admin.TabularInline):
+    model = Review
+    extra = 0
+    fields = ("author", "rate", "text", "date",)
+    readonly_fields = ("date",)
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ("id", "title", "count", "sold",)
@@ -71,13 +90,14 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ("id", "title",)
     ordering = ('date',)
     fieldsets = [
-        (_("General"), {"fields": ("title", "price", "category",)}),
+        (_("General"), {"fields": ("title", "price", "category", "subcategory",)}),
         (_("In store"), {"fields": ("count", "sold",)}),
         (_("Details"), {"fields": ("freeDelivery", "is_limited", "description",
-                                   "fullDescription", "images", "tags", "specifications",)}),
-        (_("User experience"), {"fields": ("rating", "reviews",)}),
+                                   "fullDescription", "images", "tags",)}),
+        (_("User experience"), {"fields": ("rating", "review_count",)}),
         (_("Date"), {"fields": ("date",)}),
     ]
+    inlines = (SpecificationInline, ReviewInline)
 
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         kwargs['widget'] = FilteredSelectMultiple(db_field.verbose_name, is_stacked=False)
@@ -85,21 +105,28 @@ class ProductAdmin(admin.ModelAdmin):
 
     def get_readonly_fields(self, request, obj=None):
         if request.user.is_superuser:
-            self.readonly_fields = ("date",)
+            self.readonly_fields = ("date", "review_count",)
         else:
-            self.readonly_fields = ("date", "sold", "rating", "reviews")
+            self.readonly_fields = ("date", "sold", "rating", "review_count")
         return self.readonly_fields
 
 
+@admin.register(Banner)
+class BannerAdmin(admin.ModelAdmin):
+    list_display = ("product", "position",)
+    list_editable = ("position",)
+    autocomplete_fields = ("product",)
+
+
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
-    list_display = ("author", "rate", "date",)
+    list_display = ("author", "product", "rate", "date",)
     list_filter = ("date", "rate")
     search_fields = ("author", "rate", "text", "email")
     ordering = ('date',)
 
     fieldsets = [
-        (_("Author"), {"fields": ("author", "email",)}),
+        (_("Author"), {"fields": ("product", "author", "email",)}),
         (_("Review"), {"fields": ("text", "rate",)}),
         (_("Date"), {"fields": ("date", )}),
     ]
@@ -108,13 +135,13 @@ class ReviewAdmin(admin.ModelAdmin):
         if request.user.is_superuser:
             self.readonly_fields = ("date",)
         else:
-            self.readonly_fields = ("author", "email", "text", "rate", "date",)
+            self.readonly_fields = ("product", "author", "email", "text", "rate", "date",)
         return self.readonly_fields
 
 
 @admin.register(Specification)
 class SpecificationAdmin(admin.ModelAdmin):
-    list_display = ("name", "value", )
+    list_display = ("product", "name", "value", )
     list_filter = ("name", "value", )
     search_fields = ("name", "value", )
 
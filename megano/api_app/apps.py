@@ -8,3 +8,7 @@ class ApiAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api_app'
     verbose_name = _("API-app")
+
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
@@ -0,0 +1,262 @@
+import datetime
+import hashlib
+import io
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from django.http import QueryDict
+from auth_app.models import Profile
+from .models import Avatar, Image
+
+try:
+    from PIL import Image as PILImage, ImageOps, features
+except ImportError:
+    PILImage = None
+
+# The content type sent by the browser is not trusted, uploads are recognised by their first bytes
+SIGNATURES = (
+    ("image/jpeg", b"\xff\xd8\xff", 0),
+    ("image/png", b"\x89PNG\r\n\x1a\n", 0),
+    ("image/webp", b"WEBP", 8),
+)
+# Room for the other multipart fields and boundaries next to the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class AvatarUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spools the upload to a temporary file chunk by chunk and hashes it on the
+    way, so it is never held in memory nor read twice. Reading stops as soon
+    as AVATAR_MAX_SIZE is exceeded and ``too_large`` is set.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.too_large = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > settings.AVATAR_MAX_SIZE + MULTIPART_OVERHEAD:
+            # Rejected before a single byte of the body is read
+            self.too_large = True
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.AVATAR_MAX_SIZE:
+            self.too_large = True
+            raise StopUpload()
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.sha256.hexdigest()
+        return upload
+
+
+def sniff_content_type(upload) -> str:
+    """One of AVATAR_CONTENT_TYPES the upload really is, judging by its first bytes, or None."""
+    upload.seek(0)
+    head = upload.read(16)
+    upload.seek(0)
+    for content_type, signature, offset in SIGNATURES:
+        if head[offset:offset + len(signature)] == signature and content_type in settings.AVATAR_CONTENT_TYPES:
+            return content_type
+    return None
+
+
+def avatar_directory(sha256: str) -> str:
+    return "avatars/{prefix}/{sha256}".format(prefix=sha256[:2], sha256=sha256)
+
+
+def _storage_name(src: str) -> str:
+    return src[len(settings.MEDIA_URL):] if src.startswith(settings.MEDIA_URL) else None
+
+
+def _delete_files(names) -> None:
+    for name in names:
+        if name and default_storage.exists(name):
+            default_storage.delete(name)
+
+
+def _delete_directories(directories) -> None:
+    for directory in directories:
+        if default_storage.exists(directory):
+            _, files = default_storage.listdir(directory)
+            _delete_files(["{}/{}".format(directory, name) for name in files])
+
+
+def save_avatar(user, upload, content_type: str) -> Avatar:
+    """
+    Makes ``upload`` (received by AvatarUploadHandler) the avatar of ``user``
+    and collects the avatar it replaces.
+
+    Content is stored once per hash: uploading the current avatar again
+    changes nothing, content that has been processed before reuses its
+    thumbnails, and an original already in storage is not written again.
+    Otherwise the original is moved into storage and the avatar is left
+    PENDING for process_avatar.
+    """
+    with transaction.atomic():
+        profile = Profile.objects.select_for_update().get(user=user)
+        current = Avatar.objects.filter(image_id=profile.avatar_id, sha256=upload.sha256).first()
+        if current is not None:
+            return current
+
+        processed = Avatar.objects.filter(sha256=upload.sha256, status=Avatar.READY).select_related("image").first()
+        if processed is not None:
+            image = Image.objects.create(src=processed.image.src, alt="avatar")
+            avatar = Avatar.objects.create(image=image, user=user, sha256=upload.sha256, status=Avatar.READY,
+                                           thumbnails=processed.thumbnails)
+        else:
+            name = "{directory}/original.{extension}".format(directory=avatar_directory(upload.sha256),
+                                                             extension=settings.AVATAR_CONTENT_TYPES[content_type])
+            if not default_storage.exists(name):
+                name = default_storage.save(name, upload)
+            image = Image.objects.create(src=settings.MEDIA_URL + name, alt="avatar")
+            avatar = Avatar.objects.create(image=image, user=user, sha256=upload.sha256)
+
+        profile.avatar = image
+        profile.save(update_fields=["avatar"])
+        collect_avatars(user)
+    return avatar
+
+
+def make_thumbnails(name: str, directory: str) -> dict:
+    """
+    Writes square JPEG and WebP thumbnails of AVATAR_SIZES for the image
+    stored under ``name``. Raises ValueError for images of more than
+    AVATAR_MAX_PIXELS and OSError for anything Pillow cannot read.
+    """
+    sizes = sorted(settings.AVATAR_SIZES)
+    formats = [("jpeg", "jpg", {"quality": 85, "optimize": True})]
+    if features.check("webp"):
+        formats.append(("webp", "webp", {"quality": 80, "method": 4}))
+    thumbnails = {}
+    with default_storage.open(name) as source:
+        picture = PILImage.open(source)
+        if picture.width * picture.height > settings.AVATAR_MAX_PIXELS:
+            raise ValueError("Avatar of {}x{} pixels is too large".format(picture.width, picture.height))
+        # JPEG is decoded at a reduced scale straight away, which is most of the work for phone photos
+        picture.draft("RGB", (sizes[-1], sizes[-1]))
+        picture = ImageOps.exif_transpose(picture)
+        if picture.mode != "RGB":
+            background = PILImage.new("RGBA", picture.size, "white")
+            picture = PILImage.alpha_composite(background, picture.convert("RGBA")).convert("RGB")
+        for size in sizes:
+            thumbnail = ImageOps.fit(picture, (size, size), PILImage.Resampling.LANCZOS)
+            thumbnails[str(size)] = {}
+            for image_format, extension, options in formats:
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, image_format, **options)
+                thumbnail_name = "{directory}/{size}.{extension}".format(directory=directory, size=size,
+                                                                         extension=extension)
+                _delete_files([thumbnail_name])
+                thumbnail_name = default_storage.save(thumbnail_name, ContentFile(buffer.getvalue()))
+                thumbnails[str(size)][image_format] = settings.MEDIA_URL + thumbnail_name
+    return thumbnails
+
+
+def process_avatar(avatar_id: int) -> str:
+    """
+    Makes the thumbnails of a PENDING avatar and points the Image rows of
+    every pending avatar with the same content at the largest JPEG, after
+    which the original is deleted. An image Pillow cannot read marks them
+    FAILED and takes them off their profiles. Returns the resulting status.
+
+    Without Pillow installed avatars are marked READY as they are.
+    """
+    avatar = Avatar.objects.select_related("image").filter(pk=avatar_id).first()
+    if avatar is None or avatar.status != Avatar.PENDING:
+        # Superseded and collected already, or processed together with an earlier upload of the same content
+        return avatar.status if avatar else None
+
+    original = _storage_name(avatar.image.src)
+    processed = Avatar.objects.filter(sha256=avatar.sha256, status=Avatar.READY).select_related("image").first()
+    status, thumbnails, src = Avatar.READY, {}, None
+    if processed is not None:
+        thumbnails, src = processed.thumbnails, processed.image.src
+    elif PILImage is not None:
+        try:
+            thumbnails = make_thumbnails(original, avatar_directory(avatar.sha256))
+            src = thumbnails[str(max(settings.AVATAR_SIZES))]["jpeg"]
+        except (OSError, ValueError, PILImage.DecompressionBombError):
+            status = Avatar.FAILED
+
+    with transaction.atomic():
+        pending = list(Avatar.objects.select_for_update().select_related("image")
+                       .filter(sha256=avatar.sha256, status=Avatar.PENDING))
+        images = []
+        for pending_avatar in pending:
+            pending_avatar.status = status
+            pending_avatar.thumbnails = thumbnails
+            if src is not None:
+                pending_avatar.image.src = src
+                images.append(pending_avatar.image)
+        Avatar.objects.bulk_update(pending, ["status", "thumbnails"])
+        Image.objects.bulk_update(images, ["src"])
+        if status == Avatar.FAILED:
+            Profile.objects.filter(avatar__avatar_file__in=pending).update(avatar=None)
+        if src is not None or status == Avatar.FAILED:
+            transaction.on_commit(lambda: _delete_files([original]))
+    return status
+
+
+def stale_pending_avatars() -> list:
+    """
+    Ids of avatars left PENDING for longer than AVATAR_PENDING_TIMEOUT seconds,
+    whose task was never sent or got lost. One per content hash, processing
+    it finishes every pending avatar of the same content.
+    """
+    deadline = timezone.now() - datetime.timedelta(seconds=settings.AVATAR_PENDING_TIMEOUT)
+    return list(Avatar.objects.filter(status=Avatar.PENDING, createdAt__lt=deadline).values("sha256")
+                .annotate(first=Min("pk")).order_by("first").values_list("first", flat=True))
+
+
+def collect_avatars(user=None) -> int:
+    """
+    Deletes the avatars no profile shows any more (of ``user`` or of
+    everyone) with their Image rows, and the stored files of content no
+    avatar is left for, once the transaction commits. Collecting for
+    everyone also removes avatars uploaded before they were tracked.
+    Returns the number of Image rows deleted.
+    """
+    with transaction.atomic():
+        stale = Avatar.objects.filter(image__profile__isnull=True)
+        if user is not None:
+            stale = stale.filter(user=user)
+        stale = list(stale.values_list("image_id", "sha256"))
+        image_ids = [image_id for image_id, _ in stale]
+
+        legacy = {}
+        if user is None:
+            legacy = dict(Image.objects.filter(
+                src__startswith=settings.MEDIA_URL + "avatars/", avatar_file__isnull=True, profile__isnull=True
+            ).values_list("pk", "src"))
+            image_ids += list(legacy)
+        if not image_ids:
+            return 0
+
+        Image.objects.filter(pk__in=image_ids).delete()
+        hashes = {sha256 for _, sha256 in stale}
+        hashes -= set(Avatar.objects.filter(sha256__in=hashes).values_list("sha256", flat=True))
+        directories = [avatar_directory(sha256) for sha256 in hashes]
+        files = set(legacy.values()) - set(Image.objects.filter(src__in=legacy.values()).values_list("src", flat=True))
+
+        def delete_stored():
+            _delete_directories(directories)
+            _delete_files([_storage_name(src) for src in files])
+
+        transaction.on_commit(delete_stored)
+        return len(image_ids)
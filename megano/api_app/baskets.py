@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from .models import Basket
+
+
+def change_basket(user: User, items: dict) -> None:
+    """
+    Adds ``items`` ({product id: count}, counts may be negative) to the basket
+    of ``user``. All rows are written with one upsert on the (user, product)
+    constraint; rows that drop to zero or below are removed.
+    """
+    items = {int(product_id): int(count) for product_id, count in items.items()}
+    if not items:
+        return
+    with transaction.atomic():
+        # Locking the user serializes basket writes of one user, so concurrent requests add up
+        list(User.objects.select_for_update().filter(pk=user.pk).values_list("pk", flat=True))
+        existing = dict(Basket.objects.filter(user=user, product_id__in=items).values_list("product_id", "count"))
+        totals = {product_id: existing.get(product_id, 0) + count for product_id, count in items.items()}
+        Basket.objects.bulk_create(
+            [Basket(user=user, product_id=product_id, count=total) for product_id, total in totals.items() if total > 0],
+            update_conflicts=True, unique_fields=["user", "product"], update_fields=["count"],
+        )
+        emptied = [product_id for product_id, total in totals.items() if total <= 0 and product_id in existing]
+        if emptied:
+            Basket.objects.filter(user=user, product_id__in=emptied).delete()
+
+
+def merge_session_cart(request) -> None:
+    """Moves the guest cart of the session into the basket of the user who just logged in."""
+    cart = request.session.pop("cart", None)
+    if cart:
+        change_basket(request.user, cart)
@@ -0,0 +1,135 @@
+import hashlib
+import random
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_max_age, patch_cache_control
+from rest_framework.response import Response
+
+VERSION_KEY = "storefront:version"
+CACHED_ENDPOINTS = []
+
+
+def get_cache():
+    return caches[settings.STOREFRONT_CACHE]
+
+
+def get_version_cache():
+    """Version keys are kept apart from the responses, where culling would reset them and change every ETag."""
+    return caches[settings.STOREFRONT_VERSION_CACHE]
+
+
+def get_version(key: str = VERSION_KEY, timeout: int = None) -> int:
+    cache = get_version_cache()
+    version = cache.get(key)
+    if version is None:
+        # Starting from the clock rather than 1 keeps entries of a lost version from coming back
+        version = time.time_ns()
+        cache.add(key, version, timeout=timeout)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_version() -> None:
+    """Invalidates every cached storefront response at once."""
+    cache = get_version_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def product_version_key(product_id: int) -> str:
+    return "storefront:product:{pk}:version".format(pk=product_id)
+
+
+def peek_product_version(product_id: int) -> int:
+    """The current version of a product, or None when it has none yet."""
+    return get_version_cache().get(product_version_key(product_id))
+
+
+def get_product_version(product_id: int) -> int:
+    """
+    Version of the detail payload of a product, used as its ETag. Started
+    for products that exist only (see peek_product_version) and expired
+    after PRODUCT_VERSION_TIMEOUT, so the keys stay as many as the products
+    being viewed.
+    """
+    return get_version(product_version_key(product_id), timeout=settings.PRODUCT_VERSION_TIMEOUT)
+
+
+def invalidate_products(product_ids) -> None:
+    """
+    Gives the products new versions once the current transaction commits.
+    Dropping the keys is enough, get_version starts a fresh one from the clock.
+    """
+    keys = [product_version_key(product_id) for product_id in set(product_ids)]
+    if keys:
+        transaction.on_commit(lambda: get_version_cache().delete_many(keys))
+
+
+def _count(name: str, outcome: str) -> None:
+    # Only one request in STOREFRONT_STATS_SAMPLE_RATE writes, counting for all of them
+    rate = settings.STOREFRONT_STATS_SAMPLE_RATE
+    if random.randrange(rate):
+        return
+    cache = get_cache()
+    key = "storefront:stats:{name}:{outcome}".format(name=name, outcome=outcome)
+    if not cache.add(key, rate, timeout=None):
+        try:
+            cache.incr(key, rate)
+        except ValueError:
+            cache.set(key, rate, timeout=None)
+
+
+def get_stats(names=None) -> dict:
+    cache = get_cache()
+    if names is None:
+        names = CACHED_ENDPOINTS
+    stats = {}
+    for name in names:
+        hits = cache.get("storefront:stats:{name}:hits".format(name=name), 0)
+        misses = cache.get("storefront:stats:{name}:misses".format(name=name), 0)
+        stats[name] = {"hits": hits, "misses": misses}
+    return stats
+
+
+def cached_response(name: str):
+    """
+    Caches the data of successful responses of a read-only viewset action.
+    Keys include the storefront version and the query string, so a version
+    bump from the model signals makes every cached response stale at once.
+    A ``max-age`` set by the view bounds the lifetime of the entry and is
+    counted down on the responses served from it.
+    """
+    CACHED_ENDPOINTS.append(name)
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            cache = get_cache()
+            query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+            key = "storefront:{name}:{version}:{query}".format(name=name, version=get_version(), query=query)
+            entry = cache.get(key)
+            if entry is not None:
+                _count(name, "hits")
+                data, expires = entry
+                response = Response(data)
+                if expires is not None:
+                    patch_cache_control(response, public=True, max_age=max(0, int(expires - time.time())))
+                return response
+            _count(name, "misses")
+            response = method(self, request, *args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                # A max-age set by the view also limits how long the entry is kept
+                max_age = get_max_age(response)
+                if max_age is None:
+                    cache.set(key, (response.data, None))
+                elif max_age > 0:
+                    cache.set(key, (response.data, time.time() + max_age), timeout=max_age)
+            return response
+        return wrapper
+    return decorator
+
@@ -0,0 +1,32 @@
+import hashlib
+import time
+from rest_framework.renderers import JSONRenderer
+from .cache import get_cache, get_version, get_version_cache
+from .queries import category_tree_queryset
+from .serializers import CategorySerializer
+
+CATEGORIES_VERSION_KEY = "storefront:categories:version"
+
+
+def bump_category_version() -> None:
+    """Invalidates the cached category tree, the version doubles as its modification time."""
+    get_version_cache().set(CATEGORIES_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_category_tree() -> tuple:
+    """
+    The category tree rendered to JSON, with its strong ETag and the time of
+    the last change (a Unix timestamp) for Last-Modified. The rendered bytes
+    are kept in the storefront cache and a change of a category, subcategory
+    or image makes them stale.
+    """
+    version = get_version(CATEGORIES_VERSION_KEY)
+    key = "storefront:categories:{version}".format(version=version)
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is None:
+        body = JSONRenderer().render(CategorySerializer(category_tree_queryset(), many=True).data)
+        entry = (body, '"{}"'.format(hashlib.md5(body).hexdigest()))
+        cache.set(key, entry)
+    body, etag = entry
+    return body, etag, version // 10 ** 9
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api_app.sales import apply_sales
+
+
+class Command(BaseCommand):
+    help = "Starts sales whose period has begun and ends expired ones"
+
+    def handle(self, *args, **options):
+        result = apply_sales()
+        self.stdout.write("Sales started: {started}, finished: {finished}, dropped: {dropped}".format(**result))
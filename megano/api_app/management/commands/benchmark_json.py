@@ -0,0 +1,83 @@
+import io
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from api_app.models import Category, Image, Order, OrderHistory, OrderProduct, Product, Tag
+from api_app.parsers import FastJSONParser
+from api_app.queries import order_history_queryset, product_short_queryset
+from api_app.renderers import FastJSONRenderer
+from api_app.serializers import OrderHistorySerializer, product_short_data, product_snapshot
+
+
+class Command(BaseCommand):
+    help = "Compares the stdlib and orjson JSON renderers and parsers on catalog and order history payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--orders", type=int, default=200)
+        parser.add_argument("--repeat", type=int, default=50)
+
+    def handle(self, *args, **options):
+        # Everything is created inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            user = self.fill(options["products"], options["orders"])
+            payloads = {
+                "catalog": {"items": [product_short_data(product) for product in product_short_queryset()],
+                            "currentPage": 1, "lastPage": 1},
+                "order history": OrderHistorySerializer(order_history_queryset(user.pk), many=True).data,
+            }
+            for name, data in payloads.items():
+                body = JSONRenderer().render(data)
+                assert FastJSONRenderer().render(data) == body
+                render = self.measure(lambda: JSONRenderer().render(data), options["repeat"])
+                fast_render = self.measure(lambda: FastJSONRenderer().render(data), options["repeat"])
+                parse = self.measure(lambda: JSONParser().parse(io.BytesIO(body)), options["repeat"])
+                fast_parse = self.measure(lambda: FastJSONParser().parse(io.BytesIO(body)), options["repeat"])
+                self.stdout.write(
+                    "{name:14} {size:8} bytes  render: {render:7.2f} -> {fast_render:6.2f} ms  "
+                    "parse: {parse:7.2f} -> {fast_parse:6.2f} ms".format(
+                        name=name, size=len(body), render=render, fast_render=fast_render,
+                        parse=parse, fast_parse=fast_parse))
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def fill(products, orders):
+        image = Image.objects.create(src="benchmark", alt="benchmark")
+        category = Category.objects.create(title="Benchmark", image=image)
+        images = Image.objects.bulk_create([Image(src="src {}".format(i), alt="alt") for i in range(3)])
+        tags = Tag.objects.bulk_create([Tag(name="tag {}".format(i)) for i in range(2)])
+        created = Product.objects.bulk_create([
+            Product(category=category, title="Product {}".format(number), price=number + 0.5, count=1,
+                    description="description", fullDescription="", freeDelivery=number % 2 == 0)
+            for number in range(products)
+        ], batch_size=1000)
+        Product.images.through.objects.bulk_create([
+            Product.images.through(product_id=product.pk, image_id=image.pk) for product in created for image in images
+        ], batch_size=1000)
+        Product.tags.through.objects.bulk_create([
+            Product.tags.through(product_id=product.pk, tag_id=tag.pk) for product in created for tag in tags
+        ], batch_size=1000)
+
+        user = User.objects.create_user(username="benchmark", password="benchmark")
+        snapshots = {product.pk: product_snapshot(product) for product in created[:5]}
+        for number in range(orders):
+            order = Order.objects.create(fullName="Benchmark", email="a@a.a", phone="1", deliveryType="ordinary",
+                                         paymentType="online", totalCost=100, status="accepted", city="City",
+                                         address="Street 1")
+            lines = OrderProduct.objects.bulk_create([
+                OrderProduct(product_id=product_id, count=1, price=10, snapshot=snapshot)
+                for product_id, snapshot in snapshots.items()
+            ])
+            order.products.add(*lines)
+            OrderHistory.objects.create(user=user, order=order)
+        return user
+
+    @staticmethod
+    def measure(run, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return (time.perf_counter() - started) / repeat * 1000
@@ -0,0 +1,67 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from api_app.models import Category, Image, Product, Review, Specification
+from api_app.queries import product_full_queryset
+from api_app.serializers import ProductFullSerializer
+
+
+class Command(BaseCommand):
+    help = "Measures product detail serialization and review insertion on synthetic products"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=2000)
+        parser.add_argument("--reviews", type=int, default=50, help="reviews per product")
+        parser.add_argument("--specifications", type=int, default=10, help="specifications per product")
+        parser.add_argument("--repeat", type=int, default=500)
+
+    def handle(self, *args, **options):
+        # Everything is created inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            product_ids = self.fill(options["products"], options["reviews"], options["specifications"])
+            rnd = random.Random(1)
+            sample = [rnd.choice(product_ids) for _ in range(options["repeat"])]
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for product_id in sample:
+                    ProductFullSerializer(product_full_queryset().get(pk=product_id)).data
+                detail = (time.perf_counter() - started) / len(sample) * 1000
+            self.stdout.write("product detail:   {time:8.3f} ms  {queries:5.1f} queries".format(
+                time=detail, queries=len(queries) / len(sample)))
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for product_id in sample:
+                    self.add_review(product_id, rnd.randint(1, 5))
+                insert = (time.perf_counter() - started) / len(sample) * 1000
+            self.stdout.write("review insertion: {time:8.3f} ms  {queries:5.1f} queries".format(
+                time=insert, queries=len(queries) / len(sample)))
+            transaction.set_rollback(True)
+
+    def fill(self, products, reviews, specifications):
+        image = Image.objects.create(src="benchmark", alt="benchmark")
+        category = Category.objects.create(title="Benchmark", image=image)
+        created = Product.objects.bulk_create([
+            Product(category=category, title="Product {}".format(number), price=100, count=1,
+                    description="", fullDescription="", freeDelivery=False)
+            for number in range(products)
+        ], batch_size=1000)
+        rnd = random.Random(0)
+        Review.objects.bulk_create([
+            Review(product=product, author="a", email="a@a.a", text="text", rate=rnd.randint(1, 5))
+            for product in created for _ in range(reviews)
+        ], batch_size=1000)
+        Specification.objects.bulk_create([
+            Specification(product=product, name="name", value="value")
+            for product in created for _ in range(specifications)
+        ], batch_size=1000)
+        return [product.pk for product in created]
+
+    @staticmethod
+    def add_review(product_id, rate):
+        # As in ReviewViewSet.add_review
+        product = Product.objects.get(pk=product_id)
+        Review.objects.create(product=product, author="a", email="a@a.a", text="text", rate=rate)
@@ -0,0 +1,57 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api_app.models import Category, Image, Product
+from api_app.search import rebuild_search_index, search_products
+
+WORDS = ["phone", "laptop", "camera", "headphones", "watch", "tablet", "speaker", "monitor", "keyboard",
+         "mouse", "charger", "cable", "case", "black", "white", "silver", "wireless", "smart", "pro", "mini",
+         "ultra", "portable", "gaming", "office", "travel", "sport", "classic", "premium", "budget", "kids"]
+# Model names and the like make up most of a real catalog's vocabulary
+FILLER = ["{prefix}{number}".format(prefix=prefix, number=number)
+          for prefix in ("x", "mk", "gt", "zen", "neo", "air", "max", "lite") for number in range(500)]
+QUERIES = ["phone", "smart watch", "porta", "zen42", "neo17 max3", "gaming mk250"]
+
+
+class Command(BaseCommand):
+    help = "Compares catalog name search through the full-text index with title__icontains on synthetic products"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        # Everything is created inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            self.fill(options["products"])
+            for query in QUERIES:
+                icontains = self.measure(Product.objects.filter(title__icontains=query).order_by("price"),
+                                         options["repeat"])
+                indexed = self.measure(search_products(Product.objects.all(), query).order_by("price"),
+                                       options["repeat"])
+                self.stdout.write("{query!r:24} icontains: {icontains:8.2f} ms  search index: {indexed:8.2f} ms".format(
+                    query=query, icontains=icontains, indexed=indexed))
+            transaction.set_rollback(True)
+
+    def fill(self, count):
+        image = Image.objects.create(src="benchmark", alt="benchmark")
+        category = Category.objects.create(title="Benchmark", image=image)
+        rnd = random.Random(0)
+        products = [
+            Product(category=category, title=" ".join(rnd.sample(WORDS, 2) + rnd.sample(FILLER, 2)),
+                    price=rnd.randint(1, 50000), count=1, description=" ".join(rnd.sample(FILLER, 8)),
+                    fullDescription=" ".join(rnd.sample(WORDS, 2) + rnd.sample(FILLER, 30)), freeDelivery=False)
+            for _ in range(count)
+        ]
+        Product.objects.bulk_create(products, batch_size=1000)
+        rebuild_search_index()
+
+    @staticmethod
+    def measure(queryset, repeat):
+        # The catalog counts the matches and then reads the first page
+        started = time.perf_counter()
+        for _ in range(repeat):
+            queryset.count()
+            list(queryset[:20])
+        return (time.perf_counter() - started) / repeat * 1000
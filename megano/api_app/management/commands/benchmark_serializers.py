@@ -0,0 +1,55 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from api_app.models import Category, Image, Product, Tag
+from api_app.queries import product_short_queryset
+from api_app.serializers import ProductShortSerializer, product_short_data
+
+
+class Command(BaseCommand):
+    help = "Compares ProductShortSerializer with the fast read path on a list of synthetic products"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        # Everything is created inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            self.fill(options["products"])
+            # Both paths render the same loaded products, so only serialization is measured
+            products = list(product_short_queryset().order_by("pk"))
+            renderer = JSONRenderer()
+            serializer = self.measure(lambda: renderer.render(ProductShortSerializer(products, many=True).data),
+                                      options["repeat"])
+            fast = self.measure(lambda: renderer.render([product_short_data(product) for product in products]),
+                                options["repeat"])
+            self.stdout.write("{count} products  serializer: {serializer:8.2f} ms  fast path: {fast:8.2f} ms  "
+                              "x{ratio:.1f}".format(count=len(products), serializer=serializer, fast=fast,
+                                                    ratio=serializer / fast))
+            transaction.set_rollback(True)
+
+    def fill(self, count):
+        image = Image.objects.create(src="benchmark", alt="benchmark")
+        category = Category.objects.create(title="Benchmark", image=image)
+        images = Image.objects.bulk_create([Image(src="src {}".format(i), alt="alt") for i in range(3)])
+        tags = Tag.objects.bulk_create([Tag(name="tag {}".format(i)) for i in range(2)])
+        products = Product.objects.bulk_create([
+            Product(category=category, title="Product {}".format(number), price=number + 0.5, count=1,
+                    description="description", fullDescription="", freeDelivery=number % 2 == 0)
+            for number in range(count)
+        ], batch_size=1000)
+        Product.images.through.objects.bulk_create([
+            Product.images.through(product_id=product.pk, image_id=image.pk) for product in products for image in images
+        ], batch_size=1000)
+        Product.tags.through.objects.bulk_create([
+            Product.tags.through(product_id=product.pk, tag_id=tag.pk) for product in products for tag in tags
+        ], batch_size=1000)
+
+    @staticmethod
+    def measure(render, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            render()
+        return (time.perf_counter() - started) / repeat * 1000
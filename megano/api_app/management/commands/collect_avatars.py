@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api_app.avatars import collect_avatars
+
+
+class Command(BaseCommand):
+    help = "Deletes avatars no profile shows any more, with their images and files"
+
+    def handle(self, *args, **options):
+        deleted = collect_avatars()
+        self.stdout.write("Avatars deleted: {deleted}".format(deleted=deleted))
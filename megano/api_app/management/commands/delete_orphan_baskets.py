@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from api_app.models import Basket
+
+
+class Command(BaseCommand):
+    help = "Deletes basket rows without a user left behind by old guest carts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = 0
+        while True:
+            ids = list(Basket.objects.filter(user__isnull=True).values_list("pk", flat=True)[:options["batch_size"]])
+            if not ids:
+                break
+            deleted += Basket.objects.filter(pk__in=ids).delete()[0]
+        self.stdout.write("Orphaned baskets deleted: {deleted}".format(deleted=deleted))
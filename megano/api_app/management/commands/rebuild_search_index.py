@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api_app.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Refills the product full-text search index"
+
+    def handle(self, *args, **options):
+        rebuild_search_index()
+        self.stdout.write("Search index rebuilt")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api_app.ratings import recount_reviews
+
+
+class Command(BaseCommand):
+    help = "Recomputes review count, rating sum and rating of every product from its reviews"
+
+    def handle(self, *args, **options):
+        updated = recount_reviews()
+        self.stdout.write("Products updated: {updated}".format(updated=updated))
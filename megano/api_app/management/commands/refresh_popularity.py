@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api_app.popularity import refresh_popularity
+
+
+class Command(BaseCommand):
+    help = "Brings the popularity scores of products up to date with the paid orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Recount every window from scratch")
+
+    def handle(self, *args, **options):
+        result = refresh_popularity(full=options["full"])
+        for window, changed in result.items():
+            self.stdout.write("{window}: {changed} scores changed".format(window=window, changed=changed))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api_app.cache import get_stats
+
+
+class Command(BaseCommand):
+    help = "Shows hit/miss counters of the storefront response cache, estimated from sampled requests"
+
+    def handle(self, *args, **options):
+        for name, stats in get_stats().items():
+            total = stats["hits"] + stats["misses"]
+            ratio = stats["hits"] / total * 100 if total else 0
+            self.stdout.write("{name}: {hits} hits, {misses} misses ({ratio:.1f}% hit rate)".format(
+                name=name, ratio=ratio, **stats))
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.3 on 2026-10-18 16:43
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_review_stats(apps, schema_editor):
+    Product = apps.get_model('api_app', 'Product')
+    Review = apps.get_model('api_app', 'Review')
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        review_count=Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')),
+                              0, output_field=IntegerField()),
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rate')).values('total')),
+                            0, output_field=IntegerField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0030_alter_product_images_alter_product_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.IntegerField(default=0, verbose_name='Rating sum'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.IntegerField(default=0, verbose_name='Review count'),
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.3 on 2026-10-18 16:45
+
+import api_app.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE api_app_product_fts USING fts5(
+        title, description, fullDescription, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    # Title matches weigh more than description matches
+    "INSERT INTO api_app_product_fts(api_app_product_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 1.0)')",
+    """INSERT INTO api_app_product_fts(rowid, title, description, fullDescription)
+       SELECT id, title, description, "fullDescription" FROM api_app_product""",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE api_app_product_fts",
+]
+POSTGRESQL_FORWARD = [
+    """ALTER TABLE api_app_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce("fullDescription", '')), 'C')
+    ) STORED""",
+    "CREATE INDEX api_app_product_search_vector_idx ON api_app_product USING GIN (search_vector)",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX api_app_product_search_vector_idx",
+    "ALTER TABLE api_app_product DROP COLUMN search_vector",
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0031_product_review_count_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='api_app.product', verbose_name='Product')),
+                ('document', api_app.models.FullTextField(db_column='api_app_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'api_app_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(
+            run_statements({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run_statements({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
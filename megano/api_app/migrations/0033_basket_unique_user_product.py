@@ -0,0 +1,30 @@
+# Generated by Django 4.2.3 on 2026-10-18 16:49
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_baskets(apps, schema_editor):
+    Basket = apps.get_model('api_app', 'Basket')
+    duplicates = (Basket.objects.filter(user__isnull=False).values('user', 'product')
+                  .annotate(rows=Count('pk'), total=Sum('count')).filter(rows__gt=1))
+    for duplicate in duplicates:
+        rows = Basket.objects.filter(user=duplicate['user'], product=duplicate['product']).order_by('pk')
+        first = rows.first()
+        rows.exclude(pk=first.pk).delete()
+        Basket.objects.filter(pk=first.pk).update(count=duplicate['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0032_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_baskets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='basket',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_basket_user_product'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.3 on 2026-10-18 16:53
+
+from django.db import migrations, models
+
+
+def backfill_snapshots(apps, schema_editor):
+    OrderProduct = apps.get_model('api_app', 'OrderProduct')
+    batch = []
+    for order_product in OrderProduct.objects.select_related('product').prefetch_related('product__images').iterator(
+            chunk_size=500):
+        product = order_product.product
+        images = list(product.images.all())
+        order_product.snapshot = {
+            'title': product.title,
+            'description': product.description,
+            'price': str(order_product.price),
+            'image': images[0].src if images else None,
+            'imageAlt': images[0].alt if images else None,
+            'freeDelivery': product.freeDelivery,
+            'category': product.category_id,
+        }
+        batch.append(order_product)
+        if len(batch) >= 500:
+            OrderProduct.objects.bulk_update(batch, ['snapshot'])
+            batch = []
+    OrderProduct.objects.bulk_update(batch, ['snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0033_basket_unique_user_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='snapshot',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Product snapshot'),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
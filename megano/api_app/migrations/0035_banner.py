@@ -0,0 +1,27 @@
+# Generated by Django 4.2.3 on 2026-10-18 16:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0034_orderproduct_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Banner',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0, verbose_name='Position')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='api_app.product', verbose_name='Product')),
+            ],
+            options={
+                'verbose_name': 'Pinned banner',
+                'verbose_name_plural': 'Pinned banners',
+                'ordering': ('position', 'pk'),
+            },
+        ),
+    ]
@@ -0,0 +1,93 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+RELATIONS = (("Review", "reviews"), ("Specification", "specifications"))
+
+
+def move_to_foreign_keys(apps, schema_editor):
+    Product = apps.get_model('api_app', 'Product')
+    for model_name, field_name in RELATIONS:
+        Model = apps.get_model('api_app', model_name)
+        through = Product._meta.get_field(field_name).remote_field.through
+        column = model_name.lower() + '_id'
+        owned, copies = {}, []
+        for product_id, object_id in through.objects.order_by('pk').values_list('product_id', column).iterator():
+            if object_id not in owned:
+                owned[object_id] = product_id
+            else:
+                copies.append((object_id, product_id))
+
+        by_product = {}
+        for object_id, product_id in owned.items():
+            by_product.setdefault(product_id, []).append(object_id)
+        for product_id, object_ids in by_product.items():
+            Model.objects.filter(pk__in=object_ids).update(product_id=product_id)
+
+        # Rows shared by several products are copied, so that each product owns its own
+        originals = Model.objects.in_bulk({object_id for object_id, _ in copies})
+        for object_id, product_id in copies:
+            copy = originals[object_id]
+            copy.pk = None
+            copy.product_id = product_id
+            copy.save()
+            if model_name == 'Review':
+                # auto_now_add stamps the copy with the current time
+                Model.objects.filter(pk=copy.pk).update(date=Model.objects.get(pk=object_id).date)
+
+        # Rows linked to no product cannot be kept under a required foreign key
+        Model.objects.filter(product_id__isnull=True).delete()
+
+
+def move_to_many_to_many(apps, schema_editor):
+    Product = apps.get_model('api_app', 'Product')
+    for model_name, field_name in RELATIONS:
+        Model = apps.get_model('api_app', model_name)
+        through = Product._meta.get_field(field_name).remote_field.through
+        column = model_name.lower() + '_id'
+        through.objects.bulk_create([
+            through(product_id=product_id, **{column: object_id})
+            for object_id, product_id in Model.objects.values_list('pk', 'product_id').iterator()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0036_product_subcategory_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api_app.product', verbose_name='Product'),
+        ),
+        migrations.AddField(
+            model_name='specification',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api_app.product', verbose_name='Product'),
+        ),
+        migrations.RunPython(move_to_foreign_keys, move_to_many_to_many),
+        migrations.RemoveField(
+            model_name='product',
+            name='reviews',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='specifications',
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='api_app.product', verbose_name='Product'),
+        ),
+        migrations.AlterField(
+            model_name='specification',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='specifications', to='api_app.product', verbose_name='Product'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'date'], name='review_product_date_idx'),
+        ),
+    ]
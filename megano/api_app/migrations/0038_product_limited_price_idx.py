@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0037_review_specification_product_fk'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_limited', True)), fields=['price', 'id'], name='product_limited_price_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.3 on 2026-10-18 17:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0038_product_limited_price_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(max_length=20, unique=True, verbose_name='Window')),
+                ('refreshed_at', models.DateTimeField(verbose_name='Refreshed at')),
+                ('last_history_id', models.PositiveBigIntegerField(default=0, verbose_name='Last counted order history')),
+            ],
+            options={
+                'verbose_name': 'Popularity refresh',
+                'verbose_name_plural': 'Popularity refreshes',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(max_length=20, verbose_name='Window')),
+                ('score', models.FloatField(default=0, verbose_name='Score')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='popularity', to='api_app.product', verbose_name='Product')),
+            ],
+            options={
+                'verbose_name': 'Product popularity',
+                'verbose_name_plural': 'Product popularity',
+                'indexes': [models.Index(fields=['window', '-score'], name='popularity_window_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productpopularity',
+            constraint=models.UniqueConstraint(fields=('window', 'product'), name='unique_popularity_window_product'),
+        ),
+    ]
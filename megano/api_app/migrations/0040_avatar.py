@@ -0,0 +1,33 @@
+# Generated by Django 4.2.3 on 2026-10-18 17:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api_app', '0039_product_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Avatar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, verbose_name='Content hash')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='Status')),
+                ('thumbnails', models.JSONField(blank=True, default=dict, verbose_name='Thumbnails')),
+                ('createdAt', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='avatar_file', to='api_app.image', verbose_name='Image')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='avatars', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Avatar',
+                'verbose_name_plural': 'Avatars',
+                'indexes': [models.Index(fields=['sha256', 'status'], name='avatar_sha256_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def reset_popularity(apps, schema_editor):
+    # States counted by id watermark cannot be continued, the next refresh rebuilds the scores from scratch
+    apps.get_model('api_app', 'PopularityRefresh').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0040_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderhistory',
+            name='createdAt',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Created at'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(reset_popularity, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='popularityrefresh',
+            name='last_history_id',
+        ),
+        migrations.AddField(
+            model_name='popularityrefresh',
+            name='counted_ids',
+            field=models.JSONField(blank=True, default=list, verbose_name='Recently counted order histories'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def add_description(apps, schema_editor):
+    # Snapshots written before they kept the description and the image alt
+    OrderProduct = apps.get_model('api_app', 'OrderProduct')
+    batch = []
+    for order_product in OrderProduct.objects.exclude(snapshot__has_key='description').select_related(
+            'product').prefetch_related('product__images').iterator(chunk_size=500):
+        product = order_product.product
+        images = list(product.images.all())
+        order_product.snapshot['description'] = product.description
+        order_product.snapshot['imageAlt'] = images[0].alt if images else None
+        batch.append(order_product)
+        if len(batch) >= 500:
+            OrderProduct.objects.bulk_update(batch, ['snapshot'])
+            batch = []
+    OrderProduct.objects.bulk_update(batch, ['snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0041_orderhistory_createdat_popularity_counted_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_description, migrations.RunPython.noop),
+    ]
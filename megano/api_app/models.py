@@ -15,6 +15,32 @@ class Image(models.Model):
         return "{alt} ({src_start}...{src_end})".format(alt=self.alt, src_start=self.src[:10], src_end=self.src[-20:])
 
 
+class Avatar(models.Model):
+    """
+    An avatar upload stored under the hash of its content, with the
+    thumbnails process_avatar made of it ({size: {format: url}}).
+    """
+    PENDING, READY, FAILED = "pending", "ready", "failed"
+    STATUSES = [(PENDING, _("Pending")), (READY, _("Ready")), (FAILED, _("Failed"))]
+
+    image = models.OneToOneField(Image, on_delete=models.CASCADE, related_name="avatar_file", verbose_name=_("Image"))
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="avatars", verbose_name=_("User"))
+    sha256 = models.CharField(max_length=64, verbose_name=_("Content hash"))
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING, verbose_name=_("Status"))
+    thumbnails = models.JSONField(default=dict, blank=True, verbose_name=_("Thumbnails"))
+    createdAt = models.DateTimeField(auto_now_add=True, verbose_name=_("Created at"))
+
+    class Meta:
+        verbose_name = _("Avatar")
+        verbose_name_plural = _("Avatars")
+        indexes = [
+            models.Index(fields=["sha256", "status"], name="avatar_sha256_status_idx"),
+        ]
+
+    def __str__(self):
+        return "{user} ({status})".format(user=self.user, status=self.status)
+
+
 class Category(models.Model):
     title = models.CharField(max_length=100, verbose_name=_("title"))
     image = models.ForeignKey(Image, on_delete=models.PROTECT, null=False, verbose_name=_("Image"))
@@ -64,6 +90,8 @@ class Sale(models.Model):
 
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name=_("Category"))
+    subcategory = models.ForeignKey(Subcategory, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name="products", verbose_name=_("Subcategory"))
     title = models.CharField(max_length=100, verbose_name=_("Title"))
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_("Price"))
     count = models.IntegerField(verbose_name=_("Count"))
@@ -73,21 +101,95 @@ class Product(models.Model):
     freeDelivery = models.BooleanField(verbose_name=_("Free delivery"))
     images = models.ManyToManyField(Image, related_name='images', verbose_name=_("Images"), blank=True)
     tags = models.ManyToManyField('Tag', related_name='tags', verbose_name=_("Tags"), blank=True)
-    reviews = models.ManyToManyField('Review', verbose_name=_("Reviews"), blank=True)
-    specifications = models.ManyToManyField('Specification', verbose_name=_("Specifications"), blank=True)
     rating = models.FloatField(default=0, verbose_name=_("Rating"))
+    review_count = models.IntegerField(default=0, verbose_name=_("Review count"))
+    rating_sum = models.IntegerField(default=0, verbose_name=_("Rating sum"))
     is_limited = models.BooleanField(default=False, verbose_name=_("Is limited"))
     sold = models.IntegerField(default=0, verbose_name=_("Sold"))
 
     class Meta:
         verbose_name = _("Product")
         verbose_name_plural = _("Products")
+        indexes = [
+            models.Index(fields=["category", "price"], name="product_category_price_idx"),
+            models.Index(fields=["count"], name="product_count_idx"),
+            models.Index(fields=["sold"], name="product_sold_idx"),
+            models.Index(fields=["rating"], name="product_rating_idx"),
+            # Only limited products are indexed, the home page pages them by price
+            models.Index(fields=["price", "id"], condition=models.Q(is_limited=True), name="product_limited_price_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class FullTextField(models.TextField):
+    """Hidden FTS5 column named after its table, only usable with the ``match`` lookup."""
+
+
+class ProductSearchIndex(models.Model):
+    """
+    SQLite FTS5 index over product texts, keyed by product id through rowid.
+    The virtual table is created by a migration and kept in sync by signals;
+    PostgreSQL uses a generated tsvector column on the product table instead.
+    """
+    product = models.OneToOneField(Product, on_delete=models.DO_NOTHING, primary_key=True, db_column="rowid",
+                                   db_constraint=False, related_name="search_index", verbose_name=_("Product"))
+    document = FullTextField(db_column="api_app_product_fts")
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "api_app_product_fts"
+
+
+class Banner(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, verbose_name=_("Product"))
+    position = models.PositiveIntegerField(default=0, verbose_name=_("Position"))
+
+    class Meta:
+        verbose_name = _("Pinned banner")
+        verbose_name_plural = _("Pinned banners")
+        ordering = ("position", "pk")
+
+    def __str__(self):
+        return "{position}. {product}".format(position=self.position, product=self.product)
+
+
+class ProductPopularity(models.Model):
+    """Decayed sales score of a product in one of the POPULARITY_WINDOWS, kept up to date by refresh_popularity."""
+    window = models.CharField(max_length=20, verbose_name=_("Window"))
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="popularity", verbose_name=_("Product"))
+    score = models.FloatField(default=0, verbose_name=_("Score"))
+
+    class Meta:
+        verbose_name = _("Product popularity")
+        verbose_name_plural = _("Product popularity")
+        constraints = [
+            models.UniqueConstraint(fields=["window", "product"], name="unique_popularity_window_product"),
+        ]
+        indexes = [
+            models.Index(fields=["window", "-score"], name="popularity_window_score_idx"),
+        ]
+
+
+class PopularityRefresh(models.Model):
+    """
+    How far refresh_popularity got for a window: the time scores are valid for
+    and the order histories it counted that the next run reads again, because
+    others created before them may still commit.
+    """
+    window = models.CharField(max_length=20, unique=True, verbose_name=_("Window"))
+    refreshed_at = models.DateTimeField(verbose_name=_("Refreshed at"))
+    counted_ids = models.JSONField(default=list, blank=True, verbose_name=_("Recently counted order histories"))
+
+    class Meta:
+        verbose_name = _("Popularity refresh")
+        verbose_name_plural = _("Popularity refreshes")
+
+
 class Review(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reviews", verbose_name=_("Product"))
     author = models.CharField(max_length=255, verbose_name=_("Author"))
     email = models.CharField(max_length=255, verbose_name=_("Email"))
     text = models.TextField(verbose_name=_("Review text"))
@@ -97,12 +199,17 @@ class Review(models.Model):
     class Meta:
         verbose_name = _("Review")
         verbose_name_plural = _("Reviews")
+        indexes = [
+            models.Index(fields=["product", "date"], name="review_product_date_idx"),
+        ]
 
     def __str__(self):
         return "{author} - {text}".format(author=self.author, text=self.text[:10])
 
 
 class Specification(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="specifications",
+                                verbose_name=_("Product"))
     name = models.CharField(max_length=100, verbose_name=_("Name"))
     value = models.CharField(max_length=100, verbose_name=_("Value"))
 
@@ -118,6 +225,7 @@ class OrderProduct(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name=_("Product"))
     count = models.IntegerField(verbose_name=_("Count"))
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_("Price"))
+    snapshot = models.JSONField(default=dict, blank=True, verbose_name=_("Product snapshot"))
 
     class Meta:
         verbose_name = _("Order <-> Product")
@@ -158,6 +266,9 @@ class Basket(models.Model):
     class Meta:
         verbose_name = _("Basket")
         verbose_name_plural = _("Baskets")
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="unique_basket_user_product"),
+        ]
 
     def __str__(self):
         return "#{id} {user}".format(id=self.id, user=self.user)
@@ -177,6 +288,7 @@ class Tag(models.Model):
 class OrderHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_("User"))
     order = models.ForeignKey(Order, on_delete=models.CASCADE, verbose_name=_("Order"))
+    createdAt = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name=_("Created at"))
 
     class Meta:
         verbose_name = _("Order's history")
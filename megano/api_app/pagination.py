@@ -0,0 +1,51 @@
+import base64
+import json
+from django.db.models import Q, QuerySet
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_field: str, descending: bool, value, pk: int) -> str:
+    payload = {"s": sort_field, "d": descending, "v": str(value) if value is not None else None, "id": pk}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str, sort_field: str, descending: bool) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value, pk = payload["v"], int(payload["id"])
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if payload.get("s") != sort_field or payload.get("d") != descending:
+        raise InvalidCursor(cursor)
+    return value, pk
+
+
+def keyset_page(queryset: QuerySet, sort_field: str, descending: bool, cursor: str, limit: int) -> tuple:
+    """
+    Returns one page of ``queryset`` ordered by ``sort_field`` with the primary
+    key as a tie-breaker, and an opaque cursor pointing past its last item
+    (None on the last page). An empty ``cursor`` starts from the beginning
+    and a ``limit`` below one is taken as one. Seeking by the last seen key
+    instead of an OFFSET keeps deep pages as cheap as the first one and
+    needs no COUNT query.
+    """
+    limit = max(limit, 1)
+    prefix = "-" if descending else ""
+    lookup = "lt" if descending else "gt"
+    queryset = queryset.order_by(prefix + sort_field, prefix + "pk")
+    if cursor:
+        value, pk = decode_cursor(cursor, sort_field, descending)
+        queryset = queryset.filter(
+            Q(**{"{}__{}".format(sort_field, lookup): value}) |
+            Q(**{sort_field: value, "pk__{}".format(lookup): pk})
+        )
+    items = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(sort_field, descending, getattr(last, sort_field), last.pk)
+    return items, next_cursor
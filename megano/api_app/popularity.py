@@ -0,0 +1,117 @@
+import datetime
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .cache import bump_version
+from .models import OrderHistory, PopularityRefresh, ProductPopularity
+
+# Scores below this are what is left of a single item after ~20 half-lives
+MIN_SCORE = 1e-6
+
+
+def _weight(count: int, created_at: datetime.datetime, now: datetime.datetime, half_life: float) -> float:
+    age = (now - created_at).total_seconds() / 86400
+    return count * 0.5 ** (age / half_life)
+
+
+def _sold_lines(histories):
+    return histories.values_list("order__products__product_id", "order__products__count", "order__createdAt")
+
+
+def refresh_window(window: str, days: float, now: datetime.datetime, full: bool = False) -> int:
+    """
+    Brings the scores of one window up to ``now``. A score is the sum of the
+    items of paid orders created within the last ``days`` days, each one
+    halved every ``days / 2`` days of age.
+
+    Stored scores are decayed with one UPDATE, orders paid since the last run
+    are added and orders that have left the window since then are
+    subtracted, so a run only reads the orders of the interval between two
+    refreshes. Order histories get their ids and times before they commit, so
+    each run reads the last POPULARITY_COMMIT_LAG seconds before the previous
+    one again and skips the histories it has counted already. ``full``
+    recounts the window from scratch. Returns the number of products whose
+    score changed.
+    """
+    half_life = days / 2
+    period = datetime.timedelta(days=days)
+    lag = datetime.timedelta(seconds=settings.POPULARITY_COMMIT_LAG)
+    state = PopularityRefresh.objects.select_for_update().filter(window=window).first()
+    if state is None or full:
+        ProductPopularity.objects.filter(window=window).delete()
+        if state is None:
+            state = PopularityRefresh(window=window)
+        paid = OrderHistory.objects.all()
+        state.refreshed_at = now
+    else:
+        paid = OrderHistory.objects.filter(createdAt__gt=state.refreshed_at - lag).exclude(pk__in=state.counted_ids)
+    now = max(now, state.refreshed_at)
+
+    deltas = defaultdict(float)
+    if now > state.refreshed_at:
+        ProductPopularity.objects.filter(window=window).update(
+            score=F("score") * 0.5 ** ((now - state.refreshed_at).total_seconds() / 86400 / half_life)
+        )
+        # Orders counted before that have left the window since the last run
+        counted_before = Q(createdAt__lte=state.refreshed_at - lag) | Q(pk__in=state.counted_ids)
+        expired = OrderHistory.objects.filter(counted_before, order__createdAt__gt=state.refreshed_at - period,
+                                              order__createdAt__lte=now - period)
+        for product_id, count, created_at in _sold_lines(expired):
+            if product_id is not None:
+                deltas[product_id] -= _weight(count, created_at, now, half_life)
+
+    counted = set()
+    lines = paid.filter(order__createdAt__gt=now - period).values_list(
+        "pk", "createdAt", "order__products__product_id", "order__products__count", "order__createdAt"
+    )
+    for history_id, paid_at, product_id, count, created_at in lines:
+        if paid_at > now - lag:
+            counted.add(history_id)
+        if product_id is not None:
+            deltas[product_id] += _weight(count, created_at, now, half_life)
+
+    rows = {row.product_id: row for row in ProductPopularity.objects.filter(window=window, product_id__in=deltas)}
+    changed, created = [], []
+    for product_id, delta in deltas.items():
+        if product_id in rows:
+            rows[product_id].score += delta
+            changed.append(rows[product_id])
+        elif delta > MIN_SCORE:
+            created.append(ProductPopularity(window=window, product_id=product_id, score=delta))
+    ProductPopularity.objects.bulk_update(changed, ["score"], batch_size=500)
+    ProductPopularity.objects.bulk_create(created, batch_size=500)
+    ProductPopularity.objects.filter(window=window, score__lte=MIN_SCORE).delete()
+
+    # The next run reads from ``now - lag`` again, older histories need not be remembered
+    if state.counted_ids and not full:
+        counted.update(OrderHistory.objects.filter(pk__in=state.counted_ids, createdAt__gt=now - lag)
+                       .values_list("pk", flat=True))
+    state.counted_ids = sorted(counted)
+    state.refreshed_at = now
+    state.save()
+    return len(changed) + len(created)
+
+
+def refresh_popularity(now: datetime.datetime = None, full: bool = False) -> dict:
+    """
+    Refreshes every window of POPULARITY_WINDOWS and drops the scores of
+    windows that are no longer configured. Each window is refreshed in its
+    own transaction with its state row locked, so overlapping runs wait for
+    each other instead of counting an order twice.
+    """
+    if now is None:
+        now = timezone.now()
+    windows = settings.POPULARITY_WINDOWS
+    result = {}
+    for window, days in windows.items():
+        with transaction.atomic():
+            result[window] = refresh_window(window, days, now, full)
+    with transaction.atomic():
+        dropped, _ = ProductPopularity.objects.exclude(window__in=windows).delete()
+        PopularityRefresh.objects.exclude(window__in=windows).delete()
+    if dropped or any(result.values()):
+        # The popular endpoint is cached until the storefront version changes
+        transaction.on_commit(bump_version)
+    return result
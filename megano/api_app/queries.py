@@ -0,0 +1,151 @@
+from django.conf import settings
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Q, QuerySet, Window
+from django.db.models.functions import RowNumber
+from .models import (Banner, Basket, Category, Image, OrderHistory, OrderProduct, Product, Review, Subcategory,
+                     Tag)
+
+PRODUCT_SHORT_FIELDS = ("id", "category_id", "title", "price", "count", "date",
+                        "description", "freeDelivery", "rating", "review_count")
+
+
+def product_short_queryset(queryset: QuerySet = None) -> QuerySet:
+    """
+    Products with everything ProductShortSerializer reads loaded up front:
+    images and tags are prefetched and only the serialized columns are selected.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    return queryset.only(*PRODUCT_SHORT_FIELDS).prefetch_related(
+        Prefetch("images", queryset=Image.objects.only("id", "src", "alt")),
+        Prefetch("tags", queryset=Tag.objects.only("id", "name")),
+    )
+
+
+def category_tree_queryset() -> QuerySet:
+    """Categories with their images, subcategories and subcategory images, in two queries."""
+    return Category.objects.select_related("image").prefetch_related(
+        Prefetch("subcategories", queryset=Subcategory.objects.select_related("image").order_by("pk"))
+    ).order_by("pk")
+
+
+def _ids(params, name: str) -> list:
+    # axios sends arrays as repeated ``name[]`` keys, a single value may also come as plain ``name``
+    values = params.getlist(name) + params.getlist(name + "[]")
+    return sorted({int(value) for value in values if value})
+
+
+def filter_catalog(queryset: QuerySet, params) -> QuerySet:
+    """
+    Applies the category, subcategory and tag filters of a catalog query
+    (a QueryDict) to ``queryset``. Every filter takes several ids; tags are
+    matched with EXISTS subqueries so a product is never repeated, all of
+    them with ``tagsMode=all`` and any of them otherwise.
+    """
+    categories = _ids(params, "category")
+    if categories:
+        queryset = queryset.filter(category_id__in=categories)
+    subcategories = _ids(params, "subcategory")
+    if subcategories:
+        queryset = queryset.filter(subcategory_id__in=subcategories)
+    tags = _ids(params, "tags")
+    if tags:
+        product_tags = Product.tags.through.objects.filter(product_id=OuterRef("pk"))
+        if params.get("tagsMode") == "all":
+            for tag_id in tags:
+                queryset = queryset.filter(Exists(product_tags.filter(tag_id=tag_id)))
+        else:
+            queryset = queryset.filter(Exists(product_tags.filter(tag_id__in=tags)))
+    return queryset
+
+
+def product_full_queryset() -> QuerySet:
+    """
+    Products with everything ProductFullSerializer reads prefetched; of the
+    reviews only the latest PRODUCT_LATEST_REVIEWS are loaded.
+    """
+    latest_reviews = Review.objects.order_by("-date", "-pk")[:settings.PRODUCT_LATEST_REVIEWS]
+    return Product.objects.prefetch_related(
+        "images", "tags", "specifications", Prefetch("reviews", queryset=latest_reviews, to_attr="latest_reviews")
+    )
+
+
+def session_cart_baskets(cart: dict) -> list:
+    """
+    Unsaved Basket objects for a guest session cart ({product id: count}),
+    built from a single product fetch so BasketSerializer can render them
+    without writing anything.
+    """
+    products = product_short_queryset(Product.objects.filter(pk__in=cart.keys())).in_bulk()
+    return [Basket(product=products[int(product_id)], count=count)
+            for product_id, count in cart.items() if int(product_id) in products]
+
+
+def user_basket_queryset(user) -> QuerySet:
+    """Basket rows of ``user`` with their products loaded by product_short_queryset."""
+    return Basket.objects.filter(user=user).order_by("product").prefetch_related(
+        Prefetch("product", queryset=product_short_queryset())
+    )
+
+
+def order_products_prefetch(lookup: str = "products") -> Prefetch:
+    """Prefetch of order lines; they are serialized from their snapshots, so products are not joined."""
+    return Prefetch(lookup, queryset=OrderProduct.objects.order_by("pk"))
+
+
+def order_history_queryset(user_id: int) -> QuerySet:
+    """Order history of a user, serialized by OrderHistorySerializer in a fixed number of queries."""
+    return OrderHistory.objects.filter(user_id=user_id).select_related("order").prefetch_related(
+        order_products_prefetch("order__products")
+    ).order_by("pk")
+
+
+def banner_products(count: int = 3) -> list:
+    """
+    Products for the home page banners: the ones pinned in the admin first,
+    then the top-rated product of each category, picked with one window
+    function query.
+    """
+    pinned = list(product_short_queryset(Product.objects.filter(banner__isnull=False))
+                  .order_by("banner__position", "banner__pk")[:count])
+    if len(pinned) >= count:
+        return pinned
+    top_rated = product_short_queryset().annotate(
+        category_rank=Window(RowNumber(), partition_by=F("category_id"), order_by=[F("rating").desc(), F("pk").asc()])
+    ).filter(category_rank=1).order_by("category_id")
+    pinned_ids = {product.pk for product in pinned}
+    top_rated = [product for product in top_rated[:count] if product.pk not in pinned_ids]
+    return pinned + top_rated[:count - len(pinned)]
+
+
+def catalog_facets(queryset: QuerySet) -> dict:
+    """
+    Counts for the catalog sidebar over ``queryset``: products per tag in one
+    grouped query, and the total, free delivery, availability and price bucket
+    counts (CATALOG_PRICE_BUCKETS) in one conditional aggregate.
+    """
+    tags = Tag.objects.filter(tags__in=queryset.values("pk")).values("id", "name").annotate(
+        count=Count("tags")
+    ).order_by("pk")
+
+    bounds = list(settings.CATALOG_PRICE_BUCKETS)
+    buckets = list(zip(bounds, bounds[1:] + [None]))
+    aggregates = {
+        "total": Count("pk"),
+        "freeDelivery": Count("pk", filter=Q(freeDelivery=True)),
+        "available": Count("pk", filter=Q(count__gte=1)),
+    }
+    for index, (low, high) in enumerate(buckets):
+        bucket_filter = Q(price__gte=low)
+        if high is not None:
+            bucket_filter &= Q(price__lt=high)
+        aggregates["price_{}".format(index)] = Count("pk", filter=bucket_filter)
+    counts = queryset.order_by().aggregate(**aggregates)
+
+    return {
+        "total": counts["total"],
+        "tags": list(tags),
+        "price": [{"min": low, "max": high, "count": counts["price_{}".format(index)]}
+                  for index, (low, high) in enumerate(buckets)],
+        "freeDelivery": counts["freeDelivery"],
+        "available": counts["available"],
+    }
@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Least, Round
+from .cache import bump_version, invalidate_products
+from .models import Product, Review
+
+
+def _refresh_rating(queryset: QuerySet) -> None:
+    # Products without reviews keep the rating set in the admin
+    queryset.filter(review_count__gt=0).update(
+        rating=Least(Round(Cast(F("rating_sum"), FloatField()) / F("review_count"), 1), Value(5.0))
+    )
+
+
+def update_review_stats(product_ids, count_delta: int, rate_delta: int) -> None:
+    """
+    Shifts review_count and rating_sum of the given products with F() expressions
+    and recomputes their rating in the database, so concurrent reviews never
+    overwrite each other's counters.
+    """
+    if not product_ids or not (count_delta or rate_delta):
+        return
+    queryset = Product.objects.filter(pk__in=product_ids)
+    queryset.update(review_count=F("review_count") + count_delta, rating_sum=F("rating_sum") + rate_delta)
+    _refresh_rating(queryset)
+    transaction.on_commit(bump_version)
+    invalidate_products(product_ids)
+
+
+def recount_reviews(queryset: QuerySet = None) -> int:
+    """Recomputes review_count, rating_sum and rating of products from their reviews in bulk."""
+    if queryset is None:
+        queryset = Product.objects.all()
+    reviews = Review.objects.filter(product=OuterRef("pk")).order_by().values("product")
+    updated = queryset.update(
+        review_count=Coalesce(Subquery(reviews.annotate(total=Count("pk")).values("total")),
+                              0, output_field=IntegerField()),
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum("rate")).values("total")),
+                            0, output_field=IntegerField()),
+    )
+    _refresh_rating(queryset)
+    transaction.on_commit(bump_version)
+    invalidate_products(queryset.values_list("pk", flat=True))
+    return updated
@@ -0,0 +1,83 @@
+import datetime
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+from .cache import bump_version, invalidate_products
+from .models import Product, Sale
+
+
+def apply_sales(today: datetime.date = None) -> dict:
+    """
+    Starts sales whose period has begun and ends sales whose period is over.
+
+    All transitions are written with bulk_update/delete inside one transaction.
+    Rows are locked with select_for_update(skip_locked=True) on databases that
+    support it, so several workers can run the engine at the same time and
+    each sale is processed only once. Running it again on the same day is a
+    no-op.
+    """
+    if today is None:
+        today = timezone.localdate()
+
+    with transaction.atomic():
+        due_sales = list(
+            Sale.objects.select_for_update(skip_locked=True)
+            .select_related("product")
+            .filter(is_applied=False, dateFrom__lte=today)
+        )
+        started_sales, started_products, dropped_ids = [], [], []
+        for sale in due_sales:
+            if sale.dateTo < today:
+                dropped_ids.append(sale.pk)
+                continue
+            product = sale.product
+            sale.oldPrice = product.price
+            sale.is_applied = True
+            sale.is_active = True
+            product.price = sale.salePrice
+            started_sales.append(sale)
+            started_products.append(product)
+
+        finished_sales = list(
+            Sale.objects.select_for_update(skip_locked=True)
+            .select_related("product")
+            .filter(Q(dateTo__lt=today) | Q(dateFrom__gt=today), is_active=True)
+        )
+        finished_products = []
+        for sale in finished_sales:
+            product = sale.product
+            product.price = sale.oldPrice
+            finished_products.append(product)
+            dropped_ids.append(sale.pk)
+
+        Sale.objects.bulk_update(started_sales, ["oldPrice", "is_applied", "is_active"])
+        Product.objects.bulk_update(started_products + finished_products, ["price"])
+        Sale.objects.filter(pk__in=dropped_ids).delete()
+        if started_sales or finished_sales:
+            # bulk_update sends no signals, so the storefront cache is invalidated here
+            transaction.on_commit(bump_version)
+            invalidate_products([product.pk for product in started_products + finished_products])
+
+    return {"started": len(started_sales), "finished": len(finished_sales),
+            "dropped": len(dropped_ids) - len(finished_sales)}
+
+
+def next_sale_boundary(today: datetime.date = None) -> datetime.datetime:
+    """
+    Local midnight at which the set of active sales changes next: a pending
+    sale starts or an active one ends. None when no such change is planned.
+    """
+    if today is None:
+        today = timezone.localdate()
+    dates = Sale.objects.aggregate(
+        next_start=Min("dateFrom", filter=Q(is_applied=False, dateFrom__gt=today)),
+        last_day=Min("dateTo", filter=Q(is_active=True)),
+    )
+    boundaries = []
+    if dates["next_start"]:
+        boundaries.append(dates["next_start"])
+    if dates["last_day"]:
+        boundaries.append(dates["last_day"] + datetime.timedelta(days=1))
+    if not boundaries:
+        return None
+    return timezone.make_aware(datetime.datetime.combine(min(boundaries), datetime.time.min))
@@ -0,0 +1,95 @@
+import re
+from django.contrib.postgres.search import SearchQuery, SearchVectorExact, SearchVectorField
+from django.db import connection
+from django.db.models import Expression, F, FloatField, Func, Lookup, QuerySet, Value
+from django.db.models.expressions import Col
+from .models import FullTextField
+
+TOKEN_RE = re.compile(r"\w+")
+INDEXED_FIELDS = {"title", "description", "fullDescription"}
+
+
+@FullTextField.register_lookup
+class Match(Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return "{lhs} MATCH {rhs}".format(lhs=lhs, rhs=rhs), lhs_params + rhs_params
+
+
+class SearchVectorColumn(Expression):
+    """
+    The generated ``search_vector`` column of the product table, which the
+    model does not declare. It resolves to a column of the query's own alias
+    for that table, so it is renamed with it when the queryset is nested.
+    """
+
+    def __init__(self):
+        field = SearchVectorField()
+        field.set_attributes_from_name("search_vector")
+        super().__init__(output_field=field)
+
+    def resolve_expression(self, query=None, allow_joins=True, reuse=None, summarize=False, for_save=False):
+        return Col(query.get_initial_alias(), self.output_field)
+
+
+def postgresql_search(queryset: QuerySet, tokens) -> QuerySet:
+    """The PostgreSQL branch of search_products, matching ``tokens`` against the GIN-indexed tsvector column."""
+    query = SearchQuery(" & ".join(tokens) + ":*", config="simple", search_type="raw")
+    # SearchRank would import the psycopg extras of django.contrib.postgres, ts_rank is called directly instead
+    return queryset.filter(SearchVectorExact(SearchVectorColumn(), query)).annotate(
+        search_rank=Func(SearchVectorColumn(), query, function="ts_rank", output_field=FloatField())
+    )
+
+
+def search_products(queryset: QuerySet, text: str) -> QuerySet:
+    """
+    Narrows ``queryset`` down to products whose title, description or full
+    description contain every word of ``text`` (the last one as a prefix, so
+    the catalog search works while typing) and annotates ``search_rank``,
+    where a higher value means a more relevant product.
+
+    SQLite is served by the FTS5 table, PostgreSQL by the GIN-indexed tsvector
+    column; other databases fall back to ``title__icontains``.
+    """
+    tokens = TOKEN_RE.findall(text.lower())
+    if not tokens or connection.vendor not in ("sqlite", "postgresql"):
+        return queryset.filter(title__icontains=text).annotate(search_rank=Value(0.0, output_field=FloatField()))
+    if connection.vendor == "sqlite":
+        query = " ".join('"{token}"'.format(token=token) for token in tokens) + "*"
+        # FTS5 rank is bm25, where lower is better
+        return queryset.filter(search_index__document__match=query).annotate(search_rank=-F("search_index__rank"))
+    return postgresql_search(queryset, tokens)
+
+
+def index_products(product_ids) -> None:
+    """Writes the current texts of the given products into the SQLite FTS5 table."""
+    if connection.vendor != "sqlite" or not product_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM api_app_product_fts WHERE rowid IN ({})".format(placeholders), list(product_ids))
+        cursor.execute(
+            'INSERT INTO api_app_product_fts(rowid, title, description, fullDescription) '
+            'SELECT id, title, description, "fullDescription" FROM api_app_product WHERE id IN ({})'.format(
+                placeholders), list(product_ids))
+
+
+def unindex_products(product_ids) -> None:
+    if connection.vendor != "sqlite" or not product_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM api_app_product_fts WHERE rowid IN ({})".format(placeholders), list(product_ids))
+
+
+def rebuild_search_index() -> None:
+    """Refills the SQLite FTS5 table, e.g. after bulk_create or raw SQL imports that send no signals."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM api_app_product_fts")
+        cursor.execute('INSERT INTO api_app_product_fts(rowid, title, description, fullDescription) '
+                       'SELECT id, title, description, "fullDescription" FROM api_app_product')
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from auth_app.models import Profile
 from .models import (Image, Category, Product, Review,
@@ -46,7 +47,7 @@ class ProductShortSerializer(serializers.ModelSerializer):
     reviews = serializers.SerializerMethodField()
 
     def get_reviews(self, obj):
-        return obj.reviews.count()
+        return obj.review_count
 
     class Meta:
         model = Product
@@ -63,30 +64,129 @@ class SpecificationSerializer(serializers.ModelSerializer):
 class ProductFullSerializer(serializers.ModelSerializer):
     images = ImageSerializer(many=True)
     tags = TagSerializer(many=True)
-    reviews = ReviewSerializer(many=True)
+    reviews = serializers.SerializerMethodField()
+    reviewsCount = serializers.IntegerField(source="review_count")
     specifications = SpecificationSerializer(many=True)
 
+    def get_reviews(self, obj):
+        # Only the latest reviews are embedded, the rest is paged by /api/product/<pk>/reviews/
+        reviews = getattr(obj, "latest_reviews", None)
+        if reviews is None:
+            reviews = obj.reviews.order_by("-date", "-pk")[:settings.PRODUCT_LATEST_REVIEWS]
+        return ReviewSerializer(reviews, many=True).data
+
     class Meta:
         model = Product
         fields = ['id', 'category', 'title', 'price', 'count', 'date', 'description', 'fullDescription', 'freeDelivery',
-                  'images', 'tags', 'reviews', 'specifications', 'rating']
+                  'images', 'tags', 'reviews', 'reviewsCount', 'specifications', 'rating']
+
+
+# Read-only fast path for product lists and pages. It returns the same data as the serializers above, with the
+# DRF fields built once here instead of for every serialized object
+_PRICE = serializers.DecimalField(max_digits=10, decimal_places=2)
+_DATE_TIME = serializers.DateTimeField()
+
+
+def _related(instance, name: str) -> list:
+    # Reading the prefetch cache directly saves building a related manager per object
+    cache = getattr(instance, "_prefetched_objects_cache", {})
+    if name in cache:
+        return cache[name]
+    return getattr(instance, name).all()
+
+
+def image_data(image: Image) -> dict:
+    return {"src": image.src, "alt": image.alt}
+
+
+def tag_data(tag: Tag) -> dict:
+    return {"id": tag.pk, "name": tag.name}
+
+
+def specification_data(specification: Specification) -> dict:
+    return {"name": specification.name, "value": specification.value}
+
+
+def review_data(review: Review) -> dict:
+    return {"author": review.author, "email": review.email, "text": review.text, "rate": review.rate,
+            "date": _DATE_TIME.to_representation(review.date)}
+
+
+def product_short_data(product: Product) -> dict:
+    """What ProductShortSerializer returns for ``product``, see product_short_queryset for the prefetches."""
+    return {
+        "id": product.pk,
+        "category": product.category_id,
+        "title": product.title,
+        "price": _PRICE.to_representation(product.price),
+        "count": product.count,
+        "date": _DATE_TIME.to_representation(product.date),
+        "description": product.description,
+        "freeDelivery": product.freeDelivery,
+        "images": [image_data(image) for image in _related(product, "images")],
+        "tags": [tag_data(tag) for tag in _related(product, "tags")],
+        "reviews": product.review_count,
+        "rating": product.rating,
+    }
+
+
+def product_full_data(product: Product) -> dict:
+    """What ProductFullSerializer returns for ``product``, see product_full_queryset for the prefetches."""
+    reviews = getattr(product, "latest_reviews", None)
+    if reviews is None:
+        reviews = product.reviews.order_by("-date", "-pk")[:settings.PRODUCT_LATEST_REVIEWS]
+    return {
+        "id": product.pk,
+        "category": product.category_id,
+        "title": product.title,
+        "price": _PRICE.to_representation(product.price),
+        "count": product.count,
+        "date": _DATE_TIME.to_representation(product.date),
+        "description": product.description,
+        "fullDescription": product.fullDescription,
+        "freeDelivery": product.freeDelivery,
+        "images": [image_data(image) for image in _related(product, "images")],
+        "tags": [tag_data(tag) for tag in _related(product, "tags")],
+        "reviews": [review_data(review) for review in reviews],
+        "reviewsCount": product.review_count,
+        "specifications": [specification_data(specification)
+                           for specification in _related(product, "specifications")],
+        "rating": product.rating,
+    }
+
+
+def product_snapshot(product: Product) -> dict:
+    """What an order line keeps of its product, so old orders never need the live catalog."""
+    images = list(product.images.all())
+    return {
+        "title": product.title,
+        "description": product.description,
+        "price": serializers.DecimalField(max_digits=10, decimal_places=2).to_representation(product.price),
+        "image": images[0].src if images else None,
+        "imageAlt": images[0].alt if images else None,
+        "freeDelivery": product.freeDelivery,
+        "category": product.category_id,
+    }
 
 
 class OrderProductSerializer(serializers.ModelSerializer):
-    product = ProductShortSerializer()
-
     class Meta:
         model = OrderProduct
         fields = ['product', 'count', 'price']
 
     def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        count_in_basket = instance.count
-        print("count_in_basket", count_in_basket)
-        product_value = representation['product']
-        product_value['count'] = count_in_basket
-        products = representation['product']
-        return products
+        snapshot = instance.snapshot
+        image = snapshot.get("image")
+        return {
+            "id": instance.product_id,
+            "category": snapshot.get("category"),
+            "title": snapshot.get("title"),
+            "description": snapshot.get("description", ""),
+            "price": snapshot.get("price"),
+            "count": instance.count,
+            "freeDelivery": snapshot.get("freeDelivery"),
+            "images": [{"src": image, "alt": snapshot.get("imageAlt", snapshot.get("title"))}] if image else [],
+        }
 
 
 class OrderProductListSerializer(serializers.ModelSerializer):
@@ -134,15 +234,25 @@ class BasketSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
     def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        count_in_basket = instance.count
-        product_value = representation['product']
-        product_value['count'] = count_in_basket
+        product_value = product_short_data(instance.product)
+        product_value['count'] = instance.count
         return product_value
 
 
+class AvatarImageSerializer(ImageSerializer):
+    thumbnails = serializers.SerializerMethodField()
+
+    class Meta(ImageSerializer.Meta):
+        fields = ['src', 'alt', 'thumbnails']
+
+    def get_thumbnails(self, image: Image) -> dict:
+        # Images that are not tracked avatars have no thumbnails
+        avatar = getattr(image, "avatar_file", None)
+        return avatar.thumbnails if avatar is not None else {}
+
+
 class ProfileSerializer(serializers.ModelSerializer):
-    avatar = ImageSerializer()
+    avatar = AvatarImageSerializer()
 
     class Meta:
         model = Profile
@@ -169,10 +279,10 @@ class OrderHistorySerializer(serializers.ModelSerializer):
 
 
 class SaleItemSerializer(serializers.Serializer):
-    id = serializers.IntegerField()
-    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    id = serializers.IntegerField(source="product_id")
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, source="oldPrice")
     salePrice = serializers.DecimalField(max_digits=10, decimal_places=2)
     dateFrom = serializers.DateField()
     dateTo = serializers.DateField()
-    title = serializers.CharField()
-    images = ImageSerializer(many=True)
+    title = serializers.CharField(source="product.title")
+    images = ImageSerializer(many=True, source="product.images")
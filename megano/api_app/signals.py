@@ -0,0 +1,128 @@
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from .cache import bump_version, invalidate_products
+from .categories import bump_category_version
+from .models import Banner, Category, Image, Product, Review, Sale, Specification, Subcategory, Tag
+from .ratings import update_review_stats
+from .search import INDEXED_FIELDS, index_products, unindex_products
+
+# Images are handled by storefront_image_changed, most of them (avatars) are not shown on the storefront
+STOREFRONT_MODELS = (Product, Category, Subcategory, Tag, Sale, Banner)
+# Models shown on the product page, with the through table linking them to products
+PRODUCT_RELATIONS = {
+    Image: Product.images.through,
+    Tag: Product.tags.through,
+}
+# Models that belong to a single product through a ``product`` foreign key
+PRODUCT_CHILDREN = (Sale, Review, Specification)
+
+
+def invalidate_storefront(sender, **kwargs):
+    # A bump before commit would let a concurrent miss cache the old rows under the new version
+    transaction.on_commit(bump_version)
+
+
+def invalidate_category_tree(sender, **kwargs):
+    transaction.on_commit(bump_category_version)
+
+
+def storefront_image_changed(sender, instance, created=False, **kwargs):
+    # A new image is shown nowhere until a product or category is linked to it, which invalidates by itself
+    if created:
+        return
+    links = Image.objects.filter(pk=instance.pk).aggregate(products=Count("images"), categories=Count("category"),
+                                                           subcategories=Count("subcategory"))
+    if any(links.values()):
+        invalidate_storefront(sender)
+    if links["categories"] or links["subcategories"]:
+        invalidate_category_tree(sender)
+
+
+def product_changed(sender, instance, **kwargs):
+    invalidate_products([instance.pk])
+
+
+def product_relation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith("post_"):
+            invalidate_products([instance.pk])
+    elif action == "pre_clear":
+        field = instance._meta.model_name + "_id"
+        invalidate_products(sender.objects.filter(**{field: instance.pk}).values_list("product_id", flat=True))
+    elif action.startswith("post_"):
+        invalidate_products(pk_set)
+
+
+def related_object_changed(sender, instance, **kwargs):
+    through = PRODUCT_RELATIONS[sender]
+    field = sender._meta.model_name + "_id"
+    invalidate_products(through.objects.filter(**{field: instance.pk}).values_list("product_id", flat=True))
+
+
+def product_child_changed(sender, instance, **kwargs):
+    invalidate_products([instance.product_id])
+
+
+def product_saved(sender, instance, update_fields, **kwargs):
+    if update_fields is None or INDEXED_FIELDS.intersection(update_fields):
+        index_products([instance.pk])
+
+
+def product_deleted(sender, instance, **kwargs):
+    unindex_products([instance.pk])
+
+
+def review_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        update_review_stats([instance.product_id], 1, int(instance.rate))
+
+
+def review_pre_save(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None:
+        return
+    old = Review.objects.filter(pk=instance.pk).values_list("product_id", "rate").first()
+    if old is None:
+        return
+    old_product_id, old_rate = old
+    if old_product_id != instance.product_id:
+        update_review_stats([old_product_id], -1, -old_rate)
+        update_review_stats([instance.product_id], 1, int(instance.rate))
+    elif old_rate != instance.rate:
+        update_review_stats([instance.product_id], 0, int(instance.rate) - old_rate)
+
+
+def review_deleted(sender, instance, **kwargs):
+    update_review_stats([instance.product_id], -1, -instance.rate)
+
+
+def connect_signals():
+    for model in STOREFRONT_MODELS:
+        post_save.connect(invalidate_storefront, sender=model, dispatch_uid="storefront_save_" + model.__name__)
+        post_delete.connect(invalidate_storefront, sender=model, dispatch_uid="storefront_delete_" + model.__name__)
+    for model in (Category, Subcategory):
+        post_save.connect(invalidate_category_tree, sender=model, dispatch_uid="categories_save_" + model.__name__)
+        post_delete.connect(invalidate_category_tree, sender=model, dispatch_uid="categories_delete_" + model.__name__)
+    post_save.connect(storefront_image_changed, sender=Image, dispatch_uid="storefront_save_Image")
+    # The links of the image are gone by post_delete
+    pre_delete.connect(storefront_image_changed, sender=Image, dispatch_uid="storefront_delete_Image")
+    for through in (Product.images.through, Product.tags.through):
+        m2m_changed.connect(invalidate_storefront, sender=through, dispatch_uid="storefront_m2m_" + through.__name__)
+    post_save.connect(product_changed, sender=Product, dispatch_uid="product_version_save")
+    post_delete.connect(product_changed, sender=Product, dispatch_uid="product_version_delete")
+    for model, through in PRODUCT_RELATIONS.items():
+        m2m_changed.connect(product_relation_changed, sender=through,
+                            dispatch_uid="product_version_m2m_" + through.__name__)
+        post_save.connect(related_object_changed, sender=model, dispatch_uid="product_version_save_" + model.__name__)
+        # Through rows are gone by post_delete
+        pre_delete.connect(related_object_changed, sender=model,
+                           dispatch_uid="product_version_delete_" + model.__name__)
+    for model in PRODUCT_CHILDREN:
+        post_save.connect(product_child_changed, sender=model, dispatch_uid="product_version_save_" + model.__name__)
+        post_delete.connect(product_child_changed, sender=model,
+                            dispatch_uid="product_version_delete_" + model.__name__)
+    post_save.connect(product_saved, sender=Product, dispatch_uid="product_search_index_save")
+    post_delete.connect(product_deleted, sender=Product, dispatch_uid="product_search_index_delete")
+    post_save.connect(review_saved, sender=Review, dispatch_uid="review_post_save")
+    pre_save.connect(review_pre_save, sender=Review, dispatch_uid="review_pre_save")
+    post_delete.connect(review_deleted, sender=Review, dispatch_uid="review_post_delete")
@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from .cache import bump_version, invalidate_products
+from .models import Product
+
+
+class OutOfStock(Exception):
+    def __init__(self, shortages: list):
+        super().__init__(shortages)
+        self.shortages = shortages
+
+
+def _shortages(items: dict, stock: dict) -> list:
+    return [{"id": product_id, "requested": count, "available": stock.get(product_id, 0)}
+            for product_id, count in sorted(items.items()) if stock.get(product_id, 0) < count]
+
+
+def reserve_stock(items: dict) -> None:
+    """
+    Takes ``items`` ({product id: count}) out of stock: ``count`` goes down and
+    ``sold`` goes up for the whole basket in one conditional UPDATE, which only
+    touches rows that still have enough items. Nothing is changed and
+    OutOfStock lists every short item if any of them cannot be served.
+
+    On PostgreSQL the rows are locked with select_for_update first, on SQLite
+    the write lock of the transaction does the same job.
+    """
+    items = {int(product_id): int(count) for product_id, count in items.items()}
+    if not items:
+        return
+    with transaction.atomic():
+        stock = dict(Product.objects.select_for_update().filter(pk__in=items).order_by("pk")
+                     .values_list("pk", "count"))
+        shortages = _shortages(items, stock)
+        if shortages:
+            raise OutOfStock(shortages)
+
+        requested = Case(*[When(pk=product_id, then=Value(count)) for product_id, count in items.items()],
+                         output_field=IntegerField())
+        try:
+            with transaction.atomic():
+                updated = Product.objects.filter(pk__in=items, count__gte=requested).update(
+                    count=F("count") - requested, sold=F("sold") + requested
+                )
+                if updated != len(items):
+                    raise OutOfStock([])
+        except OutOfStock:
+            # Another checkout got in between the check and the update, report the stock left after it
+            stock = dict(Product.objects.filter(pk__in=items).values_list("pk", "count"))
+            raise OutOfStock(_shortages(items, stock))
+        transaction.on_commit(bump_version)
+        invalidate_products(items)
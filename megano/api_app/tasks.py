@@ -0,0 +1,43 @@
+import logging
+from celery import shared_task
+from .avatars import collect_avatars, process_avatar, stale_pending_avatars
+from .popularity import refresh_popularity
+from .sales import apply_sales
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def apply_sales_task():
+    return apply_sales()
+
+
+@shared_task
+def refresh_popularity_task():
+    return refresh_popularity()
+
+
+@shared_task
+def process_avatar_task(avatar_id):
+    return process_avatar(avatar_id)
+
+
+@shared_task
+def collect_avatars_task():
+    return collect_avatars()
+
+
+@shared_task
+def requeue_avatars_task():
+    avatar_ids = stale_pending_avatars()
+    for avatar_id in avatar_ids:
+        queue_avatar(avatar_id)
+    return len(avatar_ids)
+
+
+def queue_avatar(avatar_id) -> None:
+    """Sends process_avatar_task; when the broker is down the avatar is left to requeue_avatars_task."""
+    try:
+        process_avatar_task.delay(avatar_id)
+    except Exception:
+        logger.exception("Could not queue processing of avatar %s", avatar_id)
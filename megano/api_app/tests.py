@@ -1,13 +1,44 @@
 import datetime
+import decimal
+import io
 import json
 import os
+import tempfile
 import django
 from django.contrib.auth.hashers import make_password
-from django.test import TestCase, RequestFactory
+import threading
+import time
+from unittest import mock
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_max_age
 from auth_app.models import Profile
-from api_app.models import Category, Image, Sale, Order, OrderHistory, Tag, Product
+from api_app.avatars import process_avatar
+from api_app.models import (Avatar, Banner, Basket, Category, Image, Sale, Order, OrderHistory, OrderProduct, Tag, Product,
+                            ProductPopularity, Review, Specification, Subcategory)
+from api_app.cache import get_cache, get_stats, get_version, get_version_cache, peek_product_version
+from api_app.categories import CATEGORIES_VERSION_KEY
+from api_app.parsers import FastJSONParser
+from api_app.popularity import refresh_popularity
+from api_app.queries import product_full_queryset, product_short_queryset
+from api_app.renderers import FastJSONRenderer
+from api_app.sales import apply_sales
+from api_app.search import postgresql_search
+from api_app.serializers import (BasketSerializer, ProductFullSerializer, ProductShortSerializer, product_full_data,
+                                 product_short_data, product_snapshot)
+from api_app.stock import OutOfStock, reserve_stock
+from api_app.tasks import requeue_avatars_task
 from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from PIL import Image as PILImage
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "megano.settings")
@@ -140,6 +171,123 @@ class CategoriesTestCase(TestCase):
         self.assertEqual(content[0].get("image").get("alt"), 'test pic')
 
 
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'storefront': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'storefront-test'},
+    'storefront_versions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'versions-test'},
+})
+class StorefrontCacheTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        get_version_cache().clear()
+        self.img = Image.objects.create(src="pic_path", alt="test pic")
+        self.category = Category.objects.create(title="Test Category", image=self.img)
+
+    @override_settings(STOREFRONT_STATS_SAMPLE_RATE=1)
+    def test_second_request_is_served_from_cache(self):
+        Tag.objects.create(name="Test Tag")
+        self.client.get(reverse("api_app:tags"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("api_app:tags"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)[0].get("name"), "Test Tag")
+        self.assertEqual(get_stats(["tags"]), {"tags": {"hits": 1, "misses": 1}})
+
+    def test_counters_are_sampled(self):
+        Tag.objects.create(name="Test Tag")
+        with mock.patch("api_app.cache.random.randrange", side_effect=[1, 0, 1]):
+            for _ in range(3):
+                self.client.get(reverse("api_app:tags"))
+        self.assertEqual(get_stats(["tags"]), {"tags": {"hits": 100, "misses": 0}})
+
+    def test_model_change_invalidates_cache(self):
+        self.client.get(reverse("api_app:categories"))
+        version = get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.title = "Renamed"
+            self.category.save()
+            # Bumped only once the change is committed
+            self.assertEqual(get_version(), version)
+        response = self.client.get(reverse("api_app:categories"))
+        self.assertEqual(json.loads(response.content)[0].get("title"), "Renamed")
+
+    def test_m2m_change_invalidates_cache(self):
+        tag = Tag.objects.create(name="Test Tag")
+        product = Product.objects.create(category=self.category, title="Product", price=10, count=5,
+                                         description="", fullDescription="", freeDelivery=True, is_limited=True)
+        self.assertEqual(json.loads(self.client.get(reverse("api_app:limited")).content)[0]["tags"], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            product.tags.add(tag)
+        content = json.loads(self.client.get(reverse("api_app:limited")).content)
+        self.assertEqual(content[0]["tags"][0]["name"], "Test Tag")
+
+    def test_only_shown_images_invalidate_cache(self):
+        product = Product.objects.create(category=self.category, title="Product", price=10, count=5,
+                                         description="", fullDescription="", freeDelivery=True)
+        shown = Image.objects.create(src="product_pic", alt="product pic")
+        with self.captureOnCommitCallbacks(execute=True):
+            product.images.add(shown)
+        version = get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            hidden = Image.objects.create(src="other_pic", alt="other pic")
+            hidden.alt = "changed"
+            hidden.save()
+            hidden.delete()
+        self.assertEqual(get_version(), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            shown.alt = "changed"
+            shown.save()
+        self.assertNotEqual(get_version(), version)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'storefront': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'storefront-test'},
+    'storefront_versions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'versions-test'},
+})
+class CategoryTreeTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        get_version_cache().clear()
+        self.img = Image.objects.create(src="pic_path", alt="test pic")
+        for number in range(3):
+            category = Category.objects.create(title="Category {}".format(number), image=self.img)
+            for sub_number in range(2):
+                Subcategory.objects.create(category=category, title="Sub {}".format(sub_number),
+                                           image=Image.objects.create(src="sub_pic", alt="sub pic"))
+        self.url = reverse("api_app:categories")
+
+    def test_tree_is_built_in_two_queries_and_cached(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        content = json.loads(response.content)
+        self.assertEqual(len(content), 3)
+        self.assertEqual(content[0]["subcategories"][1]["image"], {"src": "sub_pic", "alt": "sub pic"})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).content, response.content)
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response["ETag"].startswith('"'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_change_invalidates_tree(self):
+        etag = self.client.get(self.url)["ETag"]
+        subcategory = Subcategory.objects.first()
+        subcategory.image.alt = "changed"
+        with self.captureOnCommitCallbacks(execute=True):
+            subcategory.image.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(json.loads(response.content)[0]["subcategories"][0]["image"]["alt"], "changed")
+
+
 class CatalogTestCase(TestCase):
     fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
 
@@ -189,6 +337,335 @@ class CatalogTestCase(TestCase):
         self.assertEqual(response.data['items'][0]['title'], 'Product 1')  # Проверка имени продукта
 
 
+class CatalogMultiFilterTestCase(TestCase):
+    fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
+
+    def setUp(self):
+        self.url = reverse("api_app:catalog")
+        self.red = Tag.objects.create(name="Red")
+        self.blue = Tag.objects.create(name="Blue")
+        self.first = Product.objects.get(pk=1)
+        self.second = Product.objects.get(pk=2)
+        self.first.tags.add(self.red, self.blue)
+        self.second.tags.add(self.red)
+        self.subcategory = Subcategory.objects.create(category_id=2, title="Shirts", image=Image.objects.first())
+        self.second.subcategory = self.subcategory
+        self.second.save()
+
+    def get_titles(self, params):
+        query = {"sort": "price", "sortType": "", "filter[minPrice]": "0", "filter[maxPrice]": "50000"}
+        query.update(params)
+        response = self.client.get(self.url, data=query)
+        self.assertEqual(response.status_code, 200)
+        return [item["title"] for item in response.data["items"]]
+
+    def test_any_tag(self):
+        # A product with both tags is listed once
+        self.assertEqual(self.get_titles({"tags[]": [self.red.pk, self.blue.pk]}), ["Product 1", "Product 2"])
+
+    def test_all_tags(self):
+        titles = self.get_titles({"tags[]": [self.red.pk, self.blue.pk], "tagsMode": "all"})
+        self.assertEqual(titles, ["Product 1"])
+
+    def test_several_categories(self):
+        self.assertEqual(self.get_titles({"category": [1, 2]}), ["Product 1", "Product 2"])
+        self.assertEqual(self.get_titles({"category[]": [2]}), ["Product 2"])
+
+    def test_subcategory(self):
+        self.assertEqual(self.get_titles({"subcategory": self.subcategory.pk}), ["Product 2"])
+
+    def test_indexes_are_used(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN output is SQLite specific")
+        plans = {
+            "product_category_price_idx": Product.objects.filter(category_id__in=[1, 2], price__lte=30),
+            "product_sold_idx": Product.objects.order_by("-sold")[:4],
+            "product_rating_idx": Product.objects.order_by("-rating")[:4],
+            "product_count_idx": Product.objects.filter(count__gte=1000),
+        }
+        for index, queryset in plans.items():
+            self.assertIn(index, queryset.explain())
+
+
+class CatalogQueryCountTestCase(TestCase):
+    def setUp(self):
+        image = Image.objects.create(src="pic_path", alt="test pic")
+        category = Category.objects.create(title="Test Category", image=image)
+        tag = Tag.objects.create(name="Test Tag")
+        for i in range(30):
+            product = Product.objects.create(category=category, title="Product {}".format(i), price=10 + i,
+                                             count=5, description="", fullDescription="", freeDelivery=True)
+            product.images.add(image)
+            product.tags.add(tag)
+            Review.objects.create(product=product, author="a", email="a@a.a", text="text", rate=5)
+        self.url = reverse("api_app:catalog")
+
+    def get_catalog_page(self, limit):
+        request_data = {
+            'sort': 'price',
+            'sortType': '',
+            'filter[minPrice]': '0',
+            'filter[maxPrice]': '1000',
+            "currentPage": 1,
+            "limit": limit,
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, data=request_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['items']), limit)
+        self.assertEqual(response.data['items'][0]['reviews'], 1)
+        self.assertEqual(response.data['items'][0]['images'][0]['src'], "pic_path")
+        self.assertEqual(response.data['items'][0]['tags'][0]['name'], "Test Tag")
+        return len(queries)
+
+    def test_catalog_query_count_is_fixed(self):
+        self.assertEqual(self.get_catalog_page(1), self.get_catalog_page(30))
+
+    def test_product_short_queryset_query_count(self):
+        # products + images prefetch + tags prefetch
+        with self.assertNumQueries(3):
+            data = ProductShortSerializer(product_short_queryset().order_by("price")[:30], many=True).data
+        self.assertEqual(len(data), 30)
+        self.assertEqual(data[0]["reviews"], 1)
+
+
+class CatalogCursorTestCase(TestCase):
+    def setUp(self):
+        image = Image.objects.create(src="pic_path", alt="test pic")
+        category = Category.objects.create(title="Test Category", image=image)
+        for i in range(7):
+            product = Product.objects.create(category=category, title="Product {}".format(i), price=10 + i % 3,
+                                             count=5, description="", fullDescription="", freeDelivery=True,
+                                             rating=i % 2)
+            for _ in range(i % 4):
+                Review.objects.create(product=product, author="a", email="a@a.a", text="text", rate=5)
+        self.url = reverse("api_app:catalog")
+
+    def walk(self, sort, sort_type=""):
+        request_data = {
+            'sort': sort,
+            'sortType': sort_type,
+            'filter[minPrice]': '0',
+            'filter[maxPrice]': '1000',
+            "limit": 3,
+            "cursor": "",
+        }
+        titles, page = [], 1
+        while True:
+            request_data["currentPage"] = page
+            response = self.client.get(self.url, data=request_data)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["currentPage"], page)
+            titles.extend(item["title"] for item in response.data["items"])
+            if not response.data["nextCursor"]:
+                self.assertEqual(response.data["lastPage"], page)
+                return titles
+            self.assertEqual(response.data["lastPage"], page + 1)
+            request_data["cursor"] = response.data["nextCursor"]
+            page += 1
+
+    def test_cursor_pages_cover_catalog_for_every_sort(self):
+        for sort in ("price", "rating", "date", "reviews"):
+            for sort_type in ("", "inc"):
+                titles = self.walk(sort, sort_type)
+                self.assertEqual(sorted(titles), sorted("Product {}".format(i) for i in range(7)))
+
+    def test_cursor_order_matches_sort(self):
+        titles = self.walk("price", "inc")
+        prices = [Product.objects.get(title=title).price for title in titles]
+        self.assertEqual(prices, sorted(prices, reverse=True))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, data={'sort': 'price', 'filter[minPrice]': '0',
+                                                   'filter[maxPrice]': '1000', 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_size_below_one_is_one(self):
+        for limit in (0, -1):
+            response = self.client.get(self.url, data={'sort': 'price', 'filter[minPrice]': '0',
+                                                       'filter[maxPrice]': '1000', 'cursor': '', 'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["items"]), 1)
+            self.assertTrue(response.data["nextCursor"])
+
+
+class ReviewStatsTestCase(TestCase):
+    fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
+
+    def add_review(self, rate):
+        return self.client.post(reverse("api_app:reviews", kwargs={"pk": 1}),
+                                data={"author": "a", "email": "a@a.a", "text": "text", "rate": rate})
+
+    def test_add_review_updates_counters(self):
+        self.assertEqual(self.add_review(5).status_code, 200)
+        self.assertEqual(self.add_review(2).status_code, 200)
+        product = Product.objects.get(pk=1)
+        self.assertEqual(product.review_count, 2)
+        self.assertEqual(product.rating_sum, 7)
+        self.assertEqual(product.rating, 3.5)
+
+    def test_review_delete_and_edit_update_counters(self):
+        self.add_review(5)
+        self.add_review(3)
+        review = Product.objects.get(pk=1).reviews.get(rate=3)
+        review.rate = 1
+        review.save()
+        product = Product.objects.get(pk=1)
+        self.assertEqual((product.review_count, product.rating_sum, product.rating), (2, 6, 3.0))
+        Review.objects.filter(pk=review.pk).delete()
+        product.refresh_from_db()
+        self.assertEqual((product.review_count, product.rating_sum, product.rating), (1, 5, 5.0))
+
+    def test_moving_review_updates_both_products(self):
+        self.add_review(4)
+        review = Review.objects.get(product_id=1)
+        review.product_id = 2
+        review.save()
+        self.assertEqual(Product.objects.get(pk=1).review_count, 0)
+        product = Product.objects.get(pk=2)
+        self.assertEqual((product.review_count, product.rating_sum, product.rating), (1, 4, 4.0))
+
+    def test_recount_reviews_command(self):
+        self.add_review(4)
+        Product.objects.update(review_count=0, rating_sum=0)
+        call_command("recount_reviews", stdout=io.StringIO())
+        product = Product.objects.get(pk=1)
+        self.assertEqual((product.review_count, product.rating_sum, product.rating), (1, 4, 4.0))
+        self.assertEqual(Product.objects.get(pk=2).review_count, 0)
+
+
+class ProductReviewsTestCase(TestCase):
+    fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
+
+    def setUp(self):
+        self.url = reverse("api_app:reviews", kwargs={"pk": 1})
+        product = Product.objects.get(pk=1)
+        for number in range(12):
+            Review.objects.create(product=product, author="a", email="a@a.a", text=str(number), rate=5)
+
+    def test_reviews_are_paged_newest_first(self):
+        texts, cursor = [], None
+        while True:
+            params = {"limit": 5}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["count"], 12)
+            texts += [review["text"] for review in response.data["items"]]
+            cursor = response.data["nextCursor"]
+            if cursor is None:
+                break
+        self.assertEqual(texts, [str(number) for number in range(11, -1, -1)])
+
+    def test_limit_is_at_least_one(self):
+        for limit in (0, -3):
+            response = self.client.get(self.url, {"limit": limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([review["text"] for review in response.data["items"]], ["11"])
+
+    def test_unknown_product(self):
+        response = self.client.get(reverse("api_app:reviews", kwargs={"pk": 100}))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PRODUCT_LATEST_REVIEWS=3)
+    def test_detail_embeds_latest_reviews(self):
+        response = self.client.get(reverse("api_app:product_details", kwargs={"pk": 1}))
+        self.assertEqual([review["text"] for review in response.data["reviews"]], ["11", "10", "9"])
+        self.assertEqual(response.data["reviewsCount"], 12)
+
+    def test_add_review_returns_only_the_new_review(self):
+        response = self.client.post(self.url, data={"author": "b", "email": "b@b.b", "text": "new", "rate": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["review"]["text"], "new")
+        self.assertEqual(response.data["reviewsCount"], 13)
+        self.assertEqual(response.data["rating"], 4.7)
+
+
+class FastPathSerializationTestCase(TestCase):
+    def setUp(self):
+        image = Image.objects.create(src="pic_path", alt="test pic")
+        category = Category.objects.create(title="Test Category", image=image)
+        tags = [Tag.objects.create(name="Tag {}".format(number)) for number in range(3)]
+        prices = ["10", "10.5", "1234567.89", "0.01"]
+        for number in range(8):
+            product = Product.objects.create(category=category, title="Product {}".format(number),
+                                             price=prices[number % 4], count=number, description="short",
+                                             fullDescription="full", freeDelivery=number % 2 == 0,
+                                             rating=number / 3, is_limited=True)
+            product.images.add(*[Image.objects.create(src="src {}".format(i), alt="alt") for i in range(number % 3)])
+            product.tags.add(*tags[:number % 4])
+            for rate in range(number % 3):
+                Review.objects.create(product=product, author="a", email="a@a.a", text="text", rate=rate + 1)
+            Specification.objects.create(product=product, name="Size", value=str(number))
+
+    def test_short_output_is_identical(self):
+        products = list(product_short_queryset().order_by("pk"))
+        self.assertEqual(JSONRenderer().render([product_short_data(product) for product in products]),
+                         JSONRenderer().render(ProductShortSerializer(products, many=True).data))
+
+    def test_full_output_is_identical(self):
+        for product in product_full_queryset().order_by("pk"):
+            self.assertEqual(JSONRenderer().render(product_full_data(product)),
+                             JSONRenderer().render(ProductFullSerializer(product).data))
+
+    def test_basket_output(self):
+        user = User.objects.create_user(username="fast", password="password")
+        basket = Basket.objects.create(user=user, product=Product.objects.first(), count=3)
+        expected = ProductShortSerializer(basket.product).data
+        expected["count"] = 3
+        self.assertEqual(JSONRenderer().render(BasketSerializer(basket).data), JSONRenderer().render(expected))
+
+
+class ProductSearchTestCase(TestCase):
+    def setUp(self):
+        image = Image.objects.create(src="pic_path", alt="test pic")
+        self.category = Category.objects.create(title="Test Category", image=image)
+        self.phone = self.create_product("Smart phone", "Black phone with a big screen")
+        self.case = self.create_product("Leather case", "Case for a smart phone")
+        self.create_product("Laptop", "Silver laptop")
+
+    def create_product(self, title, description, price=10):
+        return Product.objects.create(category=self.category, title=title, price=price, count=5,
+                                      description=description, fullDescription="", freeDelivery=True)
+
+    def search(self, text, **params):
+        request_data = {'sort': 'relevance', 'filter[minPrice]': '0', 'filter[maxPrice]': '1000',
+                        'filter[name]': text}
+        request_data.update(params)
+        response = self.client.get(reverse("api_app:catalog"), data=request_data)
+        self.assertEqual(response.status_code, 200)
+        return [item["title"] for item in response.data["items"]]
+
+    def test_search_is_ranked_by_relevance(self):
+        self.assertEqual(self.search("phone"), ["Smart phone", "Leather case"])
+
+    def test_search_matches_word_prefixes_and_description(self):
+        self.assertEqual(self.search("lapt"), ["Laptop"])
+        self.assertEqual(self.search("big screen"), ["Smart phone"])
+
+    def test_search_combines_with_filters(self):
+        self.case.price = 500
+        self.case.save()
+        self.assertEqual(self.search("phone", **{'filter[minPrice]': '100'}), ["Leather case"])
+
+    def test_index_follows_changes(self):
+        self.phone.title = "Tablet"
+        self.phone.description = "Tablet"
+        self.phone.save()
+        self.assertEqual(self.search("tablet"), ["Tablet"])
+        self.assertEqual(self.search("phone"), ["Leather case"])
+        self.case.delete()
+        self.assertEqual(self.search("phone"), [])
+
+    def test_postgresql_vector_follows_the_table_alias(self):
+        # Only compiled here, the facets nest the search as a subquery where the product table is renamed
+        queryset = postgresql_search(Product.objects.all(), ["phone"])
+        sql = str(Tag.objects.filter(tags__in=queryset.values("pk")).query)
+        self.assertIn('U0."search_vector" @@', sql)
+        self.assertNotIn('"api_app_product"."search_vector"', sql)
+
+
 class PopularProductsTestCase(TestCase):
     fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
 
@@ -220,6 +697,140 @@ class PopularProductsTestCase(TestCase):
         self.assertEqual(data[0]['title'], 'Product 2')  # Проверка имени продукта
 
 
+
+@override_settings(POPULARITY_WINDOWS={"week": 7, "month": 30}, POPULARITY_WINDOW="week")
+class PopularityRankingTestCase(TestCase):
+    def setUp(self):
+        image = Image.objects.create(src="pic_path", alt="test pic")
+        category = Category.objects.create(title="Test Category", image=image)
+        self.p1, self.p2, self.p3, self.p4, self.p5 = [
+            Product.objects.create(category=category, title="Product {}".format(number), price=10, count=1,
+                                   sold=number, description="", fullDescription="", freeDelivery=True)
+            for number in range(5)
+        ]
+        self.user = User.objects.create_user(username="buyer", password="testpassword")
+        self.now = timezone.now()
+        self.url = reverse("api_app:popular-products")
+
+    def pay(self, days_ago: float, counts: dict, paid_at: datetime.datetime = None, **history):
+        order = Order.objects.create()
+        Order.objects.filter(pk=order.pk).update(createdAt=self.now - datetime.timedelta(days=days_ago))
+        for product, count in counts.items():
+            order.products.add(OrderProduct.objects.create(product=product, count=count, price=product.price))
+        history = OrderHistory.objects.create(user=self.user, order=order, **history)
+        # Paid at the time the test is at rather than the wall clock
+        OrderHistory.objects.filter(pk=history.pk).update(createdAt=paid_at or self.now)
+        return history
+
+    def scores(self, window: str) -> dict:
+        return dict(ProductPopularity.objects.filter(window=window).values_list("product_id", "score"))
+
+    def test_scores_decay_and_leave_the_window(self):
+        self.pay(0, {self.p1: 2})
+        self.pay(3.5, {self.p2: 4})
+        refresh_popularity(self.now)
+        self.assertAlmostEqual(self.scores("week")[self.p1.pk], 2)
+        self.assertAlmostEqual(self.scores("week")[self.p2.pk], 2)
+        self.assertAlmostEqual(self.scores("month")[self.p2.pk], 4 * 0.5 ** (3.5 / 15))
+
+        refresh_popularity(self.now + datetime.timedelta(days=5))
+        self.assertEqual(list(self.scores("week")), [self.p1.pk])
+        self.assertAlmostEqual(self.scores("week")[self.p1.pk], 2 * 0.5 ** (5 / 3.5))
+        self.assertEqual(sorted(self.scores("month")), [self.p1.pk, self.p2.pk])
+
+    def test_incremental_refresh_matches_full_rebuild(self):
+        self.pay(10, {self.p1: 1, self.p3: 2})
+        self.pay(6, {self.p2: 3})
+        refresh_popularity(self.now)
+        self.pay(1, {self.p1: 1}, paid_at=self.now + datetime.timedelta(days=1))
+        refresh_popularity(self.now + datetime.timedelta(days=2))
+        self.pay(0, {self.p3: 5}, paid_at=self.now + datetime.timedelta(days=2, minutes=5))
+        later = self.now + datetime.timedelta(days=3)
+        refresh_popularity(later)
+        incremental = {window: self.scores(window) for window in ("week", "month")}
+
+        refresh_popularity(later, full=True)
+        for window, scores in incremental.items():
+            rebuilt = self.scores(window)
+            self.assertEqual(sorted(scores), sorted(rebuilt))
+            for product_id, score in scores.items():
+                self.assertAlmostEqual(score, rebuilt[product_id])
+
+    def test_history_committed_late_is_counted(self):
+        # A payment that got a lower id but committed after the refresh had counted a higher one
+        self.pay(0, {self.p1: 1}, pk=100)
+        refresh_popularity(self.now)
+        self.pay(0, {self.p2: 1}, pk=50)
+        refresh_popularity(self.now + datetime.timedelta(minutes=1))
+        refresh_popularity(self.now + datetime.timedelta(minutes=2))
+        self.assertEqual(sorted(self.scores("week")), [self.p1.pk, self.p2.pk])
+        self.assertAlmostEqual(self.scores("week")[self.p1.pk], self.scores("week")[self.p2.pk])
+
+    def test_refresh_query_count_does_not_grow_with_history(self):
+        for days_ago in range(20):
+            self.pay(days_ago, {self.p1: 1, self.p2: 1})
+        refresh_popularity(self.now)
+        self.pay(0, {self.p3: 1})
+        with self.assertNumQueries(26):
+            refresh_popularity(self.now + datetime.timedelta(hours=1))
+
+    def test_endpoint_orders_by_window(self):
+        self.pay(0, {self.p3: 1})
+        self.pay(20, {self.p2: 50})
+        refresh_popularity(self.now)
+        week = [item["id"] for item in self.client.get(self.url).data]
+        month = [item["id"] for item in self.client.get(self.url, {"window": "month"}).data]
+        # The rest is filled up by all-time sales
+        self.assertEqual(week, [self.p3.pk, self.p5.pk, self.p4.pk, self.p2.pk])
+        self.assertEqual(month, [self.p2.pk, self.p3.pk, self.p5.pk, self.p4.pk])
+        self.assertEqual(self.client.get(self.url, {"window": "year"}).status_code, 400)
+
+    def test_refresh_command(self):
+        self.pay(0, {self.p1: 1})
+        out = io.StringIO()
+        call_command("refresh_popularity", "--full", stdout=out)
+        self.assertIn("week: 1 scores changed", out.getvalue())
+
+
+class LimitedProductsTestCase(TestCase):
+    def setUp(self):
+        image = Image.objects.create(src="pic_path", alt="test pic")
+        category = Category.objects.create(title="Test Category", image=image)
+        for number in range(12):
+            Product.objects.create(category=category, title="Product {}".format(number), price=10 + number % 5,
+                                   count=1, description="", fullDescription="", freeDelivery=True,
+                                   is_limited=number % 4 != 0)
+        self.url = reverse("api_app:limited")
+        self.expected = [product.title for product in Product.objects.filter(is_limited=True).order_by("-price", "-pk")]
+
+    @override_settings(LIMITED_PRODUCTS_PER_PAGE=3)
+    def test_default_cap(self):
+        response = self.client.get(self.url)
+        self.assertEqual([item["title"] for item in response.data], self.expected[:3])
+
+    def test_pages(self):
+        titles, cursor = [], ""
+        while cursor is not None:
+            with self.assertNumQueries(3):
+                response = self.client.get(self.url, {"limit": 4, "cursor": cursor})
+            titles += [item["title"] for item in response.data["items"]]
+            cursor = response.data["nextCursor"]
+        self.assertEqual(titles, self.expected)
+        self.assertEqual(self.client.get(self.url, {"cursor": "garbage"}).status_code, 400)
+
+    def test_limit_is_at_least_one(self):
+        for limit in (0, -3):
+            response = self.client.get(self.url, {"limit": limit, "cursor": ""})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([item["title"] for item in response.data["items"]], self.expected[:1])
+
+    def test_partial_index_is_used(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN output is SQLite specific")
+        plan = Product.objects.filter(is_limited=True).order_by("-price", "-pk")[:8].explain()
+        self.assertIn("product_limited_price_idx", plan)
+
+
 class SaleTestCase(TestCase):
     fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
 
@@ -231,6 +842,7 @@ class SaleTestCase(TestCase):
             dateTo=datetime.datetime.now() + datetime.timedelta(days=1)
         )
         self.sale.save()
+        apply_sales()
 
     def test_sale_success(self):
         response = self.client.get(reverse("api_app:sales"), {"currentPage": 1})
@@ -245,6 +857,124 @@ class SaleTestCase(TestCase):
         self.assertEqual(self.sale.is_applied, True)
 
 
+class SalesPagingTestCase(TestCase):
+    def setUp(self):
+        image = Image.objects.create(src="pic_path", alt="test pic")
+        category = Category.objects.create(title="Test Category", image=image)
+        self.today = timezone.localdate()
+        for i in range(5):
+            product = Product.objects.create(category=category, title="Product {}".format(i), price=10, count=5,
+                                             description="", fullDescription="", freeDelivery=True)
+            product.images.add(image)
+            Sale.objects.create(product=product, salePrice=5, dateFrom=self.today,
+                                dateTo=self.today + datetime.timedelta(days=i + 1))
+        apply_sales(self.today)
+
+    def get_sales(self, page):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("api_app:sales"), {"currentPage": page})
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    @override_settings(SALES_PER_PAGE=2)
+    def test_sales_are_paged_in_the_database(self):
+        response, first_page_queries = self.get_sales(1)
+        content = json.loads(response.content)
+        self.assertEqual((len(content["items"]), content["currentPage"], content["lastPage"]), (2, 1, 3))
+        item = content["items"][0]
+        self.assertEqual((item["title"], item["price"], item["salePrice"]), ("Product 0", "10.00", "5.00"))
+        self.assertEqual(item["images"], [{"src": "pic_path", "alt": "test pic"}])
+        response, last_page_queries = self.get_sales(3)
+        self.assertEqual(len(json.loads(response.content)["items"]), 1)
+        self.assertEqual(first_page_queries, last_page_queries)
+
+    def test_sales_are_cacheable_until_next_boundary(self):
+        response, _ = self.get_sales(1)
+        # The first sale ends after tomorrow
+        self.assertIn("public", response["Cache-Control"])
+        self.assertGreater(get_max_age(response), 24 * 60 * 60)
+        self.assertLessEqual(get_max_age(response), 2 * 24 * 60 * 60)
+
+
+class SaleEngineTestCase(TestCase):
+    fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
+
+    def setUp(self):
+        self.today = datetime.date.today()
+        self.sale = Sale.objects.create(
+            product_id=1,
+            salePrice=2,
+            dateFrom=self.today,
+            dateTo=self.today + datetime.timedelta(days=1)
+        )
+
+    def test_requests_do_not_apply_sales(self):
+        self.client.get(reverse("api_app:tags"))
+        self.sale.refresh_from_db()
+        self.assertFalse(self.sale.is_applied)
+        self.assertEqual(Product.objects.get(id=1).price, 10)
+
+    def test_apply_sales_is_idempotent(self):
+        self.assertEqual(apply_sales(self.today), {"started": 1, "finished": 0, "dropped": 0})
+        self.assertEqual(apply_sales(self.today), {"started": 0, "finished": 0, "dropped": 0})
+        self.sale.refresh_from_db()
+        self.assertTrue(self.sale.is_active)
+        self.assertEqual(self.sale.oldPrice, 10)
+        self.assertEqual(Product.objects.get(id=1).price, 2)
+
+    def test_apply_sales_restores_price_after_sale(self):
+        apply_sales(self.today)
+        result = apply_sales(self.today + datetime.timedelta(days=2))
+        self.assertEqual(result, {"started": 0, "finished": 1, "dropped": 0})
+        self.assertFalse(Sale.objects.filter(pk=self.sale.pk).exists())
+        self.assertEqual(Product.objects.get(id=1).price, 10)
+
+    def test_apply_sales_skips_future_and_drops_missed_sales(self):
+        future_sale = Sale.objects.create(product_id=2, salePrice=5, dateFrom=self.today + datetime.timedelta(days=5),
+                                          dateTo=self.today + datetime.timedelta(days=6))
+        self.sale.dateTo = self.today - datetime.timedelta(days=1)
+        self.sale.dateFrom = self.today - datetime.timedelta(days=2)
+        self.sale.save()
+        self.assertEqual(apply_sales(self.today), {"started": 0, "finished": 0, "dropped": 1})
+        future_sale.refresh_from_db()
+        self.assertFalse(future_sale.is_applied)
+        self.assertEqual(Product.objects.get(id=2).price, 20)
+
+    def test_apply_sales_command(self):
+        out = io.StringIO()
+        call_command("apply_sales", stdout=out)
+        self.assertIn("Sales started: 1", out.getvalue())
+        self.assertEqual(Product.objects.get(id=1).price, 2)
+
+
+class BannersTestCase(TestCase):
+    def setUp(self):
+        image = Image.objects.create(src="pic_path", alt="test pic")
+        self.products = {}
+        for category_number in range(2):
+            category = Category.objects.create(title="Category {}".format(category_number), image=image)
+            for rating in (3, 5, 4):
+                title = "Product {}-{}".format(category_number, rating)
+                self.products[title] = Product.objects.create(
+                    category=category, title=title, price=10, count=5, description="", fullDescription="",
+                    freeDelivery=True, rating=rating)
+
+    def get_banners(self):
+        response = self.client.get(reverse("api_app:banners"))
+        self.assertEqual(response.status_code, 200)
+        return [item["title"] for item in json.loads(response.content)]
+
+    def test_top_rated_product_per_category(self):
+        # Fewer categories than banner slots is not an error
+        with self.assertNumQueries(4):
+            self.assertEqual(self.get_banners(), ["Product 0-5", "Product 1-5"])
+
+    def test_pinned_banners_go_first(self):
+        Banner.objects.create(product=self.products["Product 1-3"], position=2)
+        Banner.objects.create(product=self.products["Product 0-5"], position=1)
+        self.assertEqual(self.get_banners(), ["Product 0-5", "Product 1-3", "Product 1-5"])
+
+
 class BasketViewSetTest(TestCase):
     fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
 
@@ -279,6 +1009,54 @@ class BasketViewSetTest(TestCase):
         self.assertEqual(content[0]["id"], 1)
         self.assertEqual(content[0]["count"], 3)
 
+    def test_guest_cart_is_read_only(self):
+        self.client.post(reverse('api_app:basket'), data={"id": 1, "count": 2})
+        with CaptureQueriesContext(connection) as one_item:
+            self.client.get(reverse('api_app:basket'))
+        self.client.post(reverse('api_app:basket'), data={"id": 2, "count": 1})
+        with CaptureQueriesContext(connection) as two_items:
+            response = self.client.get(reverse('api_app:basket'))
+        content = json.loads(response.content)
+        self.assertEqual([(item["id"], item["count"]) for item in content], [(1, 2), (2, 1)])
+        self.assertEqual(len(one_item), len(two_items))
+        self.assertFalse(Basket.objects.exists())
+
+    def test_delete_orphan_baskets_command(self):
+        for _ in range(5):
+            Basket.objects.create(user=None, product_id=1, count=1)
+        Basket.objects.create(user=self.user, product_id=1, count=1)
+        out = io.StringIO()
+        call_command("delete_orphan_baskets", batch_size=2, stdout=out)
+        self.assertIn("Orphaned baskets deleted: 5", out.getvalue())
+        self.assertEqual(Basket.objects.count(), 1)
+
+    def test_add_and_delete_item_authenticated(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('api_app:basket'), data={"id": 1, "count": 2})
+        response = self.client.post(reverse('api_app:basket'), data={"id": 1, "count": 3})
+        self.assertEqual(json.loads(response.content)[0]["count"], 5)
+        self.assertEqual(Basket.objects.get(user=self.user, product_id=1).count, 5)
+        response = self.client.delete(reverse('api_app:basket'), data={"id": 1, "count": 2},
+                                      content_type='application/json')
+        self.assertEqual(json.loads(response.content)[0]["count"], 3)
+        response = self.client.delete(reverse('api_app:basket'), data={"id": 1, "count": 3},
+                                      content_type='application/json')
+        self.assertEqual(json.loads(response.content), [])
+        self.assertFalse(Basket.objects.exists())
+
+    def test_login_merges_session_cart(self):
+        Basket.objects.create(user=self.user, product_id=1, count=1)
+        self.client.post(reverse('api_app:basket'), data={"id": 1, "count": 2})
+        self.client.post(reverse('api_app:basket'), data={"id": 2, "count": 1})
+        response = self.client.post(reverse('api_app:sign-in'), json.dumps({
+            'username': 'testuser',
+            'password': 'testpassword',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        baskets = Basket.objects.filter(user=self.user).order_by("product")
+        self.assertEqual([(basket.product_id, basket.count) for basket in baskets], [(1, 3), (2, 1)])
+        self.assertNotIn("cart", self.client.session)
+
     def test_list_unauthenticated_empty_cart(self):
         response = self.client.get(reverse('api_app:basket'))
         self.assertEqual(response.status_code, 200)
@@ -397,6 +1175,94 @@ class OrdersTestCase(TestCase):
         self.assertEqual(content.get("paymentType"), data.get("paymentType"))
 
 
+class OrderCreationQueryCountTestCase(TestCase):
+    def setUp(self):
+        image = Image.objects.create(src="pic_path", alt="test pic")
+        category = Category.objects.create(title="Test Category", image=image)
+        self.products = [
+            Product.objects.create(category=category, title="Product {}".format(i), price=10 + i, count=5,
+                                   description="", fullDescription="", freeDelivery=True)
+            for i in range(50)
+        ]
+
+    def create_order(self, products):
+        cart = [{"id": product.pk, "count": 2, "price": "0.01"} for product in products]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('api_app:orders'), data=cart, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return Order.objects.get(pk=response.data["orderId"]), len(queries)
+
+    def test_order_creation_takes_constant_queries(self):
+        _, one_line = self.create_order(self.products[:1])
+        order, fifty_lines = self.create_order(self.products)
+        self.assertEqual(one_line, fifty_lines)
+        order_products = order.products.order_by("product_id")
+        self.assertEqual(order_products.count(), 50)
+        self.assertEqual([order_product.price for order_product in order_products],
+                         [product.price for product in self.products])
+
+
+class OrderHistoryTestCase(TestCase):
+    def setUp(self):
+        image = Image.objects.create(src="pic_path", alt="test pic")
+        category = Category.objects.create(title="Test Category", image=image)
+        tag = Tag.objects.create(name="Test Tag")
+        self.products = []
+        for i in range(2):
+            product = Product.objects.create(category=category, title="Product {}".format(i), price=10, count=5,
+                                             description="About {}".format(i), fullDescription="", freeDelivery=True)
+            product.images.add(image)
+            product.tags.add(tag)
+            self.products.append(product)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(fullName="John Doe")
+            for product in self.products:
+                order.products.add(OrderProduct.objects.create(product=product, count=1, price=product.price,
+                                                               snapshot=product_snapshot(product)))
+            OrderHistory.objects.create(user=self.user, order=order)
+
+    def get_history(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_app:orders'), data=params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content), len(queries)
+
+    def test_history_takes_constant_queries(self):
+        query_counts, created = [], 0
+        for total in (1, 10, 100):
+            self.create_orders(total - created)
+            created = total
+            content, query_count = self.get_history()
+            self.assertEqual(len(content), total)
+            self.assertEqual(content[-1]["products"][1]["title"], "Product 1")
+            self.assertEqual(content[-1]["products"][1]["images"][0]["src"], "pic_path")
+            query_counts.append(query_count)
+        self.assertEqual(len(set(query_counts)), 1)
+
+    def test_history_is_read_from_snapshots(self):
+        self.create_orders(1)
+        Product.objects.filter(pk=self.products[0].pk).update(title="Renamed", price=99, description="Changed")
+        content, queries = self.get_history()
+        line = content[0]["products"][0]
+        self.assertEqual((line["title"], line["price"], line["count"]), ("Product 0", "10.00", 1))
+        self.assertEqual(line["description"], "About 0")
+        self.assertEqual(line["images"], [{"src": "pic_path", "alt": "test pic"}])
+        response = self.client.get(reverse('api_app:order', kwargs={"pk": content[0]["id"]}))
+        self.assertEqual(json.loads(response.content)["products"][0]["title"], "Product 0")
+
+    def test_history_pagination_and_since(self):
+        self.create_orders(3)
+        content, _ = self.get_history(currentPage=2, limit=2)
+        self.assertEqual((len(content["items"]), content["currentPage"], content["lastPage"]), (1, 2, 2))
+        Order.objects.filter(pk=content["items"][0]["id"]).update(createdAt=timezone.now() + datetime.timedelta(days=2))
+        content, _ = self.get_history(since=(datetime.date.today() + datetime.timedelta(days=1)).isoformat())
+        self.assertEqual(len(content), 1)
+
+
 class PaymentTestCase(TestCase):
     fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
 
@@ -433,6 +1299,71 @@ class PaymentTestCase(TestCase):
         self.assertEqual(response.status_code, 500)
 
 
+class StockReservationTestCase(TestCase):
+    fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
+
+    def test_reserve_stock(self):
+        reserve_stock({1: 2, 2: 1})
+        self.assertEqual(list(Product.objects.order_by("pk").values_list("count", "sold")), [(3, 12), (0, 6)])
+
+    def test_reserve_stock_reports_every_short_item(self):
+        with self.assertRaises(OutOfStock) as error:
+            reserve_stock({1: 6, 2: 2})
+        self.assertEqual(error.exception.shortages, [{"id": 1, "requested": 6, "available": 5},
+                                                     {"id": 2, "requested": 2, "available": 1}])
+        self.assertEqual(list(Product.objects.order_by("pk").values_list("count", "sold")), [(5, 10), (1, 5)])
+
+    def test_payment_with_short_basket_changes_nothing(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        Basket.objects.create(user=user, product_id=1, count=2)
+        Basket.objects.create(user=user, product_id=2, count=3)
+        order = Order.objects.create()
+        self.client.force_login(user)
+        payment_data = {"name": "Megano Payment Tester", "number": "1234567891234567",
+                        "year": "99", "month": "12", "code": "123"}
+        response = self.client.post(reverse('api_app:payment', kwargs={"pk": order.pk}),
+                                    data=payment_data, content_type='application/json')
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(json.loads(response.content), {"shortages": [{"id": 2, "requested": 3, "available": 1}]})
+        self.assertEqual(Product.objects.get(pk=1).count, 5)
+        self.assertEqual(Basket.objects.filter(user=user).count(), 2)
+
+
+class StockReservationStressTestCase(TransactionTestCase):
+    fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        Product.objects.filter(pk=1).update(count=10, sold=0)
+        results = []
+
+        def checkout():
+            try:
+                while True:
+                    try:
+                        reserve_stock({1: 1})
+                        results.append("reserved")
+                        return
+                    except OutOfStock:
+                        results.append("short")
+                        return
+                    except OperationalError:
+                        # SQLite reports a busy database instead of waiting for the lock
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(25)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product = Product.objects.get(pk=1)
+        self.assertEqual(results.count("reserved"), 10)
+        self.assertEqual(results.count("short"), 15)
+        self.assertEqual((product.count, product.sold), (0, 10))
+
+
 class ProfileTestCase(TestCase):
     def setUp(self) -> None:
         self.user = User.objects.create_user(username='testuser', password='testpassword')
@@ -473,6 +1404,159 @@ class ProfileTestCase(TestCase):
         self.assertTrue(self.user.check_password("new_password"))
 
 
+class AvatarTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, AVATAR_SIZES=[32, 64])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        delay = mock.patch("api_app.tasks.process_avatar_task.delay")
+        self.delay = delay.start()
+        self.addCleanup(delay.stop)
+
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.profile = Profile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.url = reverse("api_app:avatar")
+
+    def picture(self, color="red", size=(300, 200), image_format="PNG") -> SimpleUploadedFile:
+        buffer = io.BytesIO()
+        PILImage.new("RGB", size, color).save(buffer, image_format)
+        return SimpleUploadedFile("photo.png", buffer.getvalue(), content_type="image/png")
+
+    def upload(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {"avatar": upload})
+
+    def stored(self) -> set:
+        return {os.path.relpath(os.path.join(root, name), self.media_root)
+                for root, _, files in os.walk(self.media_root) for name in files}
+
+    def test_upload_is_processed_into_thumbnails(self):
+        response = self.upload(self.picture())
+        self.assertEqual(response.status_code, 200)
+        avatar = Avatar.objects.get(user=self.user)
+        self.assertEqual(avatar.status, Avatar.PENDING)
+        self.assertTrue(response.data["src"].endswith("/original.png"))
+        self.delay.assert_called_once_with(avatar.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_avatar(avatar.pk), Avatar.READY)
+        directory = "avatars/{}/{}".format(avatar.sha256[:2], avatar.sha256)
+        self.assertEqual(self.stored(), {"{}/{}".format(directory, name)
+                                         for name in ("32.jpg", "32.webp", "64.jpg", "64.webp")})
+        with PILImage.open(os.path.join(self.media_root, directory, "64.webp")) as thumbnail:
+            self.assertEqual(thumbnail.size, (64, 64))
+
+        avatar = self.client.get(reverse("api_app:profile")).data["avatar"]
+        self.assertEqual(avatar["src"], "/uploads/{}/64.jpg".format(directory))
+        self.assertEqual(avatar["thumbnails"]["32"]["webp"], "/uploads/{}/32.webp".format(directory))
+
+    def test_profile_is_saved_with_the_avatar_it_loaded_before_processing(self):
+        self.upload(self.picture())
+        loaded = self.client.get(reverse("api_app:profile")).data
+        avatar = Avatar.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            process_avatar(avatar.pk)
+
+        response = self.client.post(reverse("api_app:profile"), data={**loaded, "fullName": "New Name"},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.fullName, "New Name")
+        self.assertEqual(self.profile.avatar_id, avatar.image_id)
+        self.assertTrue(response.data["avatar"]["src"].endswith("/64.jpg"))
+
+        response = self.client.post(reverse("api_app:profile"), data={**loaded, "avatar": None},
+                                    content_type="application/json")
+        self.assertIsNone(response.data["avatar"])
+
+    def test_broker_outage_leaves_avatar_to_be_requeued(self):
+        self.delay.side_effect = OSError("broker is down")
+        with self.assertLogs("api_app.tasks", "ERROR"):
+            self.assertEqual(self.upload(self.picture()).status_code, 200)
+        avatar = Avatar.objects.get()
+        self.assertEqual(avatar.status, Avatar.PENDING)
+
+        self.delay.reset_mock(side_effect=True)
+        self.assertEqual(requeue_avatars_task(), 0)
+        Avatar.objects.filter(pk=avatar.pk).update(createdAt=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(requeue_avatars_task(), 1)
+        self.delay.assert_called_once_with(avatar.pk)
+
+    def test_same_content_is_stored_once(self):
+        self.upload(self.picture())
+        process_avatar(Avatar.objects.get().pk)
+        self.assertEqual(self.upload(self.picture()).status_code, 200)
+        self.assertEqual(Avatar.objects.count(), 1)
+
+        other = User.objects.create_user(username="other", password="testpassword")
+        Profile.objects.create(user=other)
+        self.client.force_login(other)
+        files = self.stored()
+        response = self.upload(self.picture())
+        self.assertEqual(Avatar.objects.get(user=other).status, Avatar.READY)
+        self.assertTrue(response.data["src"].endswith("/64.jpg"))
+        self.assertEqual(self.stored(), files)
+        self.assertEqual(self.delay.call_count, 1)
+
+    def test_superseded_avatar_is_collected(self):
+        self.upload(self.picture("red"))
+        first = Avatar.objects.get()
+        process_avatar(first.pk)
+        self.upload(self.picture("blue"))
+        self.assertFalse(Image.objects.filter(pk=first.image_id).exists())
+        self.assertEqual(Avatar.objects.get().status, Avatar.PENDING)
+        self.assertFalse(any(first.sha256 in name for name in self.stored()))
+
+        self.profile.refresh_from_db()
+        self.profile.avatar = None
+        self.profile.save()
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("collect_avatars", stdout=out)
+        self.assertIn("Avatars deleted: 1", out.getvalue())
+        self.assertEqual(self.stored(), set())
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'storefront': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'storefront-test'},
+        'storefront_versions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'versions-test'},
+    })
+    def test_avatars_leave_storefront_versions_alone(self):
+        get_version_cache().clear()
+        versions = get_version(), get_version(CATEGORIES_VERSION_KEY)
+        self.upload(self.picture("red"))
+        with self.captureOnCommitCallbacks(execute=True):
+            process_avatar(Avatar.objects.get().pk)
+        # Replacing the avatar deletes the Image row of the first one
+        self.upload(self.picture("blue"))
+        self.assertEqual((get_version(), get_version(CATEGORIES_VERSION_KEY)), versions)
+
+    @override_settings(AVATAR_MAX_SIZE=1000)
+    def test_size_and_type_limits(self):
+        # Over the limit by far is refused before the body is read, slightly over while it is received
+        self.assertEqual(self.upload(self.picture(size=(600, 600), image_format="BMP")).status_code, 413)
+        noise = SimpleUploadedFile("photo.png", b"\x89PNG\r\n\x1a\n" + os.urandom(5000), content_type="image/png")
+        self.assertEqual(self.upload(noise).status_code, 413)
+        fake = SimpleUploadedFile("photo.png", b"<svg></svg>", content_type="image/png")
+        self.assertEqual(self.upload(fake).status_code, 415)
+        self.assertEqual(self.stored(), set())
+        self.assertFalse(Avatar.objects.exists())
+
+    def test_unreadable_image_fails(self):
+        broken = SimpleUploadedFile("photo.png", b"\x89PNG\r\n\x1a\n" + b"0" * 100, content_type="image/png")
+        self.upload(broken)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_avatar(Avatar.objects.get().pk), Avatar.FAILED)
+        self.profile.refresh_from_db()
+        self.assertIsNone(self.profile.avatar)
+        self.assertEqual(self.stored(), set())
+
+
 class TagsTestCase(TestCase):
     def setUp(self) -> None:
         self.tag = Tag.objects.create(name="Test Tag")
@@ -484,6 +1568,38 @@ class TagsTestCase(TestCase):
         self.assertEqual(content[0].get("name"), "Test Tag")
 
 
+class CatalogFacetsTestCase(TestCase):
+    fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
+
+    def setUp(self):
+        self.tag = Tag.objects.create(name="Facet Tag")
+        self.product = Product.objects.get(pk=1)
+        self.product.tags.add(self.tag)
+
+    def test_facets(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("api_app:catalog-facets"))
+        self.assertEqual(response.status_code, 200)
+        products = Product.objects.all()
+        self.assertEqual(response.data["total"], products.count())
+        self.assertEqual(response.data["freeDelivery"], products.filter(freeDelivery=True).count())
+        self.assertEqual(response.data["available"], products.filter(count__gte=1).count())
+        self.assertEqual(sum(bucket["count"] for bucket in response.data["price"]), products.count())
+        self.assertIn({"id": self.tag.pk, "name": "Facet Tag", "count": 1}, response.data["tags"])
+
+    def test_facets_of_category(self):
+        category_id = self.product.category_id
+        response = self.client.get(reverse("api_app:catalog-facets"), {"category": category_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total"], Product.objects.filter(category_id=category_id).count())
+
+    def test_tags_of_category(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("api_app:tags"), {"category": self.product.category_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([tag["name"] for tag in response.data], ["Facet Tag"])
+
+
 class ProductTestCase(TestCase):
     fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
 
@@ -502,3 +1618,99 @@ class ProductTestCase(TestCase):
         self.assertEqual(content.get("fullDescription"), product.fullDescription)
         self.assertEqual(content.get("freeDelivery"), product.freeDelivery)
         self.assertEqual(content.get("rating"), product.rating)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'storefront': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'storefront-test'},
+    'storefront_versions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'versions-test'},
+})
+class ProductConditionalGetTestCase(TestCase):
+    fixtures = ["fixtures/images_fixtures.json", "fixtures/categories_fixtures.json", "fixtures/catalog_fixture.json"]
+
+    def setUp(self):
+        get_cache().clear()
+        get_version_cache().clear()
+        self.url = reverse("api_app:product_details", kwargs={"pk": 1})
+        self.product = Product.objects.get(pk=1)
+
+    def get_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def test_not_modified_skips_database_and_serializer(self):
+        response = self.client.get(self.url)
+        self.assertIn("s-maxage=60", response["Cache-Control"])
+        with mock.patch("api_app.views.product_full_data") as product_full_data:
+            with self.assertNumQueries(0):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        product_full_data.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], self.get_etag())
+
+    def test_etag_survives_response_cache_eviction(self):
+        etag = self.get_etag()
+        get_cache().clear()
+        self.assertEqual(self.get_etag(), etag)
+
+    def test_unknown_product_gets_no_version(self):
+        url = reverse("api_app:product_details", kwargs={"pk": 999999})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"1"').status_code, 404)
+        self.assertIsNone(peek_product_version(999999))
+
+    def test_version_expires(self):
+        with override_settings(PRODUCT_VERSION_TIMEOUT=1):
+            etag = self.get_etag()
+        with mock.patch("time.time", return_value=time.time() + 2):
+            self.assertIsNone(peek_product_version(1))
+        self.assertNotEqual(self.get_etag(), etag)
+
+    def test_changes_give_new_etag(self):
+        changes = [
+            lambda: self.product.save(),
+            lambda: Review.objects.create(product=self.product, author="a", email="a@a.a", text="t", rate=5),
+            lambda: Specification.objects.create(product=self.product, name="Size", value="XL"),
+            lambda: Specification.objects.filter(name="Size").first().save(),
+            lambda: reserve_stock({1: 1}),
+            lambda: Sale.objects.create(product=self.product, salePrice=5, dateFrom=datetime.date.today(),
+                                        dateTo=datetime.date.today()),
+        ]
+        etag = self.get_etag()
+        for change in changes:
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+
+
+class FastJSONTestCase(TestCase):
+    data = {
+        "price": decimal.Decimal("10.50"),
+        "createdAt": datetime.datetime(2023, 8, 1, 12, 30, 15, 250, tzinfo=datetime.timezone.utc),
+        "local": timezone.localtime(datetime.datetime(2023, 8, 1, 12, 30, tzinfo=datetime.timezone.utc)),
+        "naive": datetime.datetime(2023, 8, 1, 12, 30),
+        "dateFrom": datetime.date(2023, 8, 1),
+        "title": "Смартфон\u2028\"quoted\"",
+        "lazy": gettext_lazy("Product"),
+        1: [1, 2.5, True, None],
+    }
+
+    def test_renderer_output_matches_stdlib(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        with mock.patch("api_app.renderers.orjson", None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_renderer_indent_and_big_integers(self):
+        data = {"big": 2 ** 70, "items": [1, 2]}
+        self.assertEqual(FastJSONRenderer().render(data, "application/json; indent=4"),
+                         JSONRenderer().render(data, "application/json; indent=4"))
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parser(self):
+        body = JSONRenderer().render({"author": "Иван", "rate": 5, "items": [{"id": 1, "count": 2.5}]})
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"rate": NaN}'))
@@ -4,7 +4,8 @@ from .views import (
     CategoriesViewSet, CatalogViewSet, login_view, logout_view,
     BasketViewSet, OrdersViewSet, PaymentViewSet, sign_up_view,
     ProfileViewSet, AvatarViewSet, SetPasswordViewSet,
-    PopularProductsViewSet, TagsViewSet, ReviewViewSet, SalesViewSet
+    PopularProductsViewSet, TagsViewSet, ReviewViewSet, SalesViewSet,
+    CatalogFacetsViewSet
 )
 
 app_name = "api_app"
@@ -16,8 +17,9 @@ urlpatterns = [
 
     path("categories/", CategoriesViewSet.as_view({"get": "list"}), name="categories"),
     path("catalog/", CatalogViewSet.as_view({'get': 'list'}), name="catalog"),
+    path("catalog/facets/", CatalogFacetsViewSet.as_view({'get': 'list'}), name="catalog-facets"),
     path("products/popular/", PopularProductsViewSet.as_view({"get": "list"}), name="popular-products"),
-    path("products/limited/", LimitedProductsViewSet.as_view({"get": "list"})),
+    path("products/limited/", LimitedProductsViewSet.as_view({"get": "list"}), name="limited"),
     path("sales/", SalesViewSet.as_view({"get": "list"}), name="sales"),
     path("banners/", BannersViewSet.as_view({"get": "list"}), name="banners"),
 
@@ -36,5 +38,5 @@ urlpatterns = [
     path("tags/", TagsViewSet.as_view({"get": "list"}), name="tags"),
 
     path("product/<int:pk>/", ProductViewSet.as_view({"get": "retrieve"}), name="product_details"),
-    path("product/<int:pk>/reviews/", ReviewViewSet.as_view({"post": "add_review"}), name="reviews"),
+    path("product/<int:pk>/reviews/", ReviewViewSet.as_view({"get": "list", "post": "add_review"}), name="reviews"),
 ]
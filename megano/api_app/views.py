@@ -1,18 +1,34 @@
+import datetime
 import json
 from django.conf import settings
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.core.files.storage import default_storage
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Prefetch
 from django.http import HttpResponse, HttpRequest, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.core.paginator import Paginator
-from .models import Sale
+from .avatars import AvatarUploadHandler, save_avatar, sniff_content_type
+from .baskets import change_basket, merge_session_cart
+from .cache import cached_response, get_product_version, peek_product_version
+from .categories import get_category_tree
+from .models import Avatar, Sale
+from .pagination import InvalidCursor, keyset_page
+from .queries import (banner_products, catalog_facets, filter_catalog, order_history_queryset,
+                      order_products_prefetch, product_full_queryset, product_short_queryset, session_cart_baskets,
+                      user_basket_queryset)
+from .sales import next_sale_boundary
+from .search import search_products
 from .serializers import *
+from .stock import OutOfStock, reserve_stock
+from .tasks import queue_avatar
 from django.db import transaction
 from auth_app.models import Profile
 
@@ -26,6 +42,7 @@ def login_view(request: HttpRequest):
             user = authenticate(request, username=username, password=password)
             if user is not None:
                 login(request, user)
+                merge_session_cart(request)
                 return HttpResponse(status=200)
         return HttpResponse(status=500)
 
@@ -52,6 +69,7 @@ def sign_up_view(request: HttpRequest):
                 user = authenticate(request, username=username, password=password)
                 if user is not None:
                     login(request, user)
+                    merge_session_cart(request)
                     return HttpResponse(status=201)
             return HttpResponse(status=400)
     except Exception:
@@ -66,11 +84,14 @@ def logout_view(request):
 
 
 class CategoriesViewSet(viewsets.ViewSet):
-    def list(self, request: HttpRequest) -> Response:
+    def list(self, request: HttpRequest) -> HttpResponse:
         try:
-            category_queryset = Category.objects.all()
-            serializer = CategorySerializer(category_queryset, many=True)
-            return Response(serializer.data)
+            body, etag, last_modified = get_category_tree()
+            response = HttpResponse(body, content_type="application/json")
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+            patch_cache_control(response, public=True, no_cache=True)
+            return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
         except Exception:
             return Response(status=500)
 
@@ -92,112 +113,110 @@ class CatalogViewSet(viewsets.ViewSet):
             if data.get("filter[available]") == "true":
                 count_param = Q(count__gte=1)
                 filter_params = filter_params & count_param
+            queryset = filter_catalog(Product.objects.filter(filter_params), request.GET)
             if data.get("filter[name]"):
-                name_param = Q(title__icontains=data.get("filter[name]"))
-                filter_params = filter_params & name_param
-            if data.get("tags[]"):
-                tag_param = Q(tags__id=data.get("tags[]"))
-                filter_params = filter_params & tag_param
-            if data.get("category"):
-                category_param = Q(category=data.get("category"))
-                filter_params = filter_params & category_param
+                queryset = search_products(queryset, data.get("filter[name]"))
+
             if "reviews" in sort_param:
-                queryset = Product.objects.annotate(num_related=Count('reviews')).filter(filter_params).order_by('-num_related')
+                sort_field, descending = "review_count", True
+            elif "relevance" in sort_param:
+                # Without a search query there is nothing to rank, newest products go first
+                sort_field = "search_rank" if data.get("filter[name]") else "date"
+                descending = True
             else:
-                queryset = Product.objects.filter(filter_params).order_by(sort_param)
+                sort_field, descending = sort_param.lstrip("-"), sort_param.startswith("-")
+            queryset = product_short_queryset(queryset).order_by(("-" if descending else "") + sort_field)
 
             items_per_page = int(data.get("limit", 20))
-            paginator = Paginator(queryset, items_per_page)
             page_number = int(data.get("currentPage", 1))
+            if "cursor" in data:
+                # Keyset mode: no COUNT(*), lastPage only tells whether there is a next page
+                try:
+                    items, next_cursor = keyset_page(queryset, sort_field, descending,
+                                                     data.get("cursor"), items_per_page)
+                except InvalidCursor:
+                    return Response(status=400)
+                last_page = page_number + 1 if next_cursor else page_number
+                items = [product_short_data(product) for product in items]
+                return Response({"items": items, "currentPage": page_number, "lastPage": last_page,
+                                 "nextCursor": next_cursor})
+
+            paginator = Paginator(queryset, items_per_page)
             page = paginator.get_page(page_number)
-            serializer = ProductShortSerializer(page.object_list, many=True)
-            return Response({"items": serializer.data, "currentPage": page.number, "lastPage": paginator.num_pages})
+            items = [product_short_data(product) for product in page.object_list]
+            return Response({"items": items, "currentPage": page.number, "lastPage": paginator.num_pages})
         except Exception:
             return Response(status=500)
 
 
 class PopularProductsViewSet(viewsets.ViewSet):
+    @cached_response("popular")
     def list(self, request: HttpRequest) -> Response:
         try:
-            queryset = Product.objects.filter(Q(count__gt=0)).order_by("-sold")[:4]
-            serializer = ProductShortSerializer(queryset, many=True)
-            return Response(serializer.data)
+            window = request.query_params.get("window", settings.POPULARITY_WINDOW)
+            if window not in settings.POPULARITY_WINDOWS:
+                return Response(status=400)
+            products = list(product_short_queryset(Product.objects.filter(popularity__window=window, count__gt=0))
+                            .order_by("-popularity__score", "pk")[:4])
+            if len(products) < 4:
+                # Until enough recent orders are counted the ranking is filled up by all-time sales
+                products += product_short_queryset(Product.objects.filter(Q(count__gt=0)).exclude(
+                    pk__in=[product.pk for product in products]
+                )).order_by("-sold")[:4 - len(products)]
+            return Response([product_short_data(product) for product in products])
         except Exception:
             return Response(status=500)
 
 
 class LimitedProductsViewSet(viewsets.ViewSet):
+    @cached_response("limited")
     def list(self, request: HttpRequest) -> Response:
         try:
-            queryset = Product.objects.filter(is_limited=True).order_by('-price')
-            serializer = ProductShortSerializer(queryset, many=True)
-            return Response(serializer.data)
+            data = request.query_params
+            limit = min(int(data.get("limit", settings.LIMITED_PRODUCTS_PER_PAGE)), settings.LIMITED_PRODUCTS_MAX)
+            queryset = product_short_queryset(Product.objects.filter(is_limited=True))
+            try:
+                items, next_cursor = keyset_page(queryset, "price", True, data.get("cursor"), limit)
+            except InvalidCursor:
+                return Response(status=400)
+            items = [product_short_data(product) for product in items]
+            # The home page reads a plain list, a cursor (empty for the first page) switches to pages
+            if "cursor" in data:
+                return Response({"items": items, "nextCursor": next_cursor})
+            return Response(items)
         except Exception:
             return HttpResponse(status=500)
 
 
 class SalesViewSet(viewsets.ViewSet):
+    @cached_response("sales")
     def list(self, request):
         try:
-            queryset = Sale.objects.filter(is_active=True)
-            items = []
-            for sale in queryset:
-                product = sale.product
-                id = product.pk
-                price = sale.oldPrice
-                salePrice = sale.salePrice
-                date_from = sale.dateFrom
-                date_to = sale.dateTo
-                title = product.title
-                images = product.images.all()
-                images = ImageSerializer(images, many=True).data
-                item = {
-                    "id": id,
-                    "price": price,
-                    "salePrice": salePrice,
-                    "dateFrom": date_from,
-                    "dateTo": date_to,
-                    "title": title,
-                    "images": images
-                }
-
-
-
-                items.append(item)
-
-
-
-
-            items_per_page = 20
-            paginator = Paginator(items, items_per_page)
-            page_number = int(request.query_params.get("currentPage"))
-            page = paginator.get_page(page_number)
-
-            data = {
-                'items': page.object_list,
-                'currentPage': request.query_params.get("currentPage"),
-                'lastPage': paginator.num_pages,
-            }
-            print("Data in VIEW", data)
-
-            return JsonResponse(data, safe=False)
+            queryset = Sale.objects.filter(is_active=True).select_related("product").only(
+                "product_id", "oldPrice", "salePrice", "dateFrom", "dateTo", "product__title"
+            ).prefetch_related(
+                Prefetch("product__images", queryset=Image.objects.only("id", "src", "alt"))
+            ).order_by("pk")
+            paginator = Paginator(queryset, settings.SALES_PER_PAGE)
+            page = paginator.get_page(int(request.query_params.get("currentPage", 1)))
+            serializer = SaleItemSerializer(page.object_list, many=True)
+            response = Response({"items": serializer.data, "currentPage": page.number,
+                                 "lastPage": paginator.num_pages})
+            boundary = next_sale_boundary()
+            if boundary is not None:
+                # The page stays valid until the next sale starts or ends
+                patch_cache_control(response, public=True,
+                                    max_age=max(0, int((boundary - timezone.now()).total_seconds())))
+            return response
         except Exception:
             return Response(status=500)
 
 
 class BannersViewSet(viewsets.ViewSet):
+    @cached_response("banners")
     def list(self, request: HttpRequest) -> Response:
         try:
-            categories = Category.objects.all()
-            banner_items = []
-            cat_i = 0
-            while len(banner_items) < 3:
-                category = categories[cat_i]
-                cat_i += 1
-                product = Product.objects.filter(category=category).order_by("-rating")[:1].first()
-                banner_items.append(product)
-            serializer = ProductShortSerializer(banner_items, many=True)
-            return Response(serializer.data)
+            return Response([product_short_data(product) for product in banner_products()])
         except Exception:
             return Response(status=500)
 
@@ -207,26 +226,14 @@ class BasketViewSet(viewsets.ViewSet):
     def list(self, request: HttpRequest) -> Response:
         try:
             if request.user.is_authenticated:
-                resp = request.session.get("cart")
-                if request.user.is_authenticated:
-                    queryset = Basket.objects.filter(user=request.user)
-                    serializer = BasketSerializer(queryset, many=True)
-                    return Response(serializer.data)
-                return Response(status=200)
+                queryset = user_basket_queryset(request.user)
+                serializer = BasketSerializer(queryset, many=True)
+                return Response(serializer.data)
 
             else:
                 cart = request.session.get("cart")
                 if cart:
-                    products = []
-                    for product_id, count in cart.items():
-                        new_product = Basket.objects.create(
-                            user=None,
-                            product_id=product_id,
-                            count=count
-                        )
-                        products.append(new_product)
-
-                    serializer = BasketSerializer(products, many=True)
+                    serializer = BasketSerializer(session_cart_baskets(cart), many=True)
                     return Response(serializer.data)
                 else:
                     return Response(status=200)
@@ -237,24 +244,9 @@ class BasketViewSet(viewsets.ViewSet):
     def add_product(self,  request: HttpRequest):
         try:
             if request.user.is_authenticated:
-                all_products = Basket.objects.filter(user=request.user).order_by('product')
-                current_product = all_products.filter(product_id=request.data['id']).first()
-                if current_product:
-                    current_product.count += int(request.data.get("count"))
-                else:
-                    current_product = Basket.objects.create(
-                        user=request.user,
-                        product_id=request.data['id'],
-                        count=request.data['count']
-                    )
-                    sale = Sale.objects.filter(product_id=request.data['id']).first()
-                    if sale:
-                        current_product.product.price = sale.salePrice
-                        current_product.product.save()
-
-                current_product.save()
-                serializer = BasketSerializer(all_products, many=True)
-                return JsonResponse(serializer.data, safe=False)
+                change_basket(request.user, {request.data['id']: request.data['count']})
+                serializer = BasketSerializer(user_basket_queryset(request.user), many=True)
+                return Response(serializer.data)
             else:
                 cart = request.session.get("cart", {})
                 if str(request.data.get("id")) in cart.keys():
@@ -262,16 +254,7 @@ class BasketViewSet(viewsets.ViewSet):
                 else:
                     cart[str(request.data["id"])] = int(request.data["count"])
                 request.session["cart"] = cart
-                products = []
-                for product_id, count in cart.items():
-                    new_product = Basket.objects.create(
-                        user=None,
-                        product_id=product_id,
-                        count=count
-                    )
-                    new_product.save()
-                    products.append(new_product)
-                serializer = BasketSerializer(products, many=True)
+                serializer = BasketSerializer(session_cart_baskets(cart), many=True)
                 return Response(serializer.data)
         except Exception:
             return Response(status=500)
@@ -281,17 +264,9 @@ class BasketViewSet(viewsets.ViewSet):
         try:
             if request.user.is_authenticated:
                 data = json.loads(request.body)
-                all_products = Basket.objects.filter(user=request.user).order_by('product')
-                current_product = all_products.filter(product_id=data['id']).first()
-
-                if current_product:
-                    current_product.count -= data.get("count")
-                    if current_product.count <= 0:
-                        current_product.delete()
-                    else:
-                        current_product.save()
-                serializer = BasketSerializer(all_products, many=True)
-                return JsonResponse(serializer.data, safe=False)
+                change_basket(request.user, {data['id']: -int(data.get("count"))})
+                serializer = BasketSerializer(user_basket_queryset(request.user), many=True)
+                return Response(serializer.data)
             else:
                 cart = request.session.get("cart", {})
                 data = json.loads(request.body)
@@ -301,16 +276,7 @@ class BasketViewSet(viewsets.ViewSet):
                     if cart[str(data["id"])] <= 0:
                        del cart[str(data["id"])]
                 request.session["cart"] = cart
-                products = []
-                for product_id, count in cart.items():
-                    new_product = Basket.objects.create(
-                        user=None,
-                        product_id=product_id,
-                        count=count
-                    )
-                    new_product.save()
-                    products.append(new_product)
-                serializer = BasketSerializer(products, many=True)
+                serializer = BasketSerializer(session_cart_baskets(cart), many=True)
                 return Response(serializer.data)
         except Exception:
             return Response(status=500)
@@ -319,7 +285,7 @@ class BasketViewSet(viewsets.ViewSet):
 class OrdersViewSet(viewsets.ViewSet):
     def retrieve(self, request, pk):
         try:
-            queryset = Order.objects.get(pk=pk)
+            queryset = Order.objects.prefetch_related(order_products_prefetch()).get(pk=pk)
             serializer = OrderSerializer(queryset)
             return Response(serializer.data)
         except Exception:
@@ -327,34 +293,59 @@ class OrdersViewSet(viewsets.ViewSet):
 
     def create(self, request):
         try:
-            data = request.data
-            is_lack = all([(Product.objects.filter(id=cart_item.get("id")).values("count").first().get("count") -
-                            cart_item.get("count")) < 0 for cart_item in data])
-            if is_lack:
-                return Response(status=405)
-            new_order = Order.objects.create()
-            if request.user.is_authenticated:
-                user = request.user.profile
-                new_order.fullName = user.fullName
-                new_order.email = user.email
-                new_order.phone = user.phone
-            products_list = []
-            for item in data:
-                new_order_product = OrderProduct.objects.create(
-                    product_id=item.get("id"),
-                    count=item.get("count"),
-                    price=item.get("price")
-                )
-                products_list.append(new_order_product)
-            new_order.products.set(products_list)
-            new_order.save()
+            items = {}
+            for cart_item in request.data:
+                product_id = int(cart_item.get("id"))
+                items[product_id] = items.get(product_id, 0) + int(cart_item.get("count"))
+            with transaction.atomic():
+                products = Product.objects.only(
+                    "id", "title", "description", "price", "count", "freeDelivery", "category_id"
+                ).prefetch_related(Prefetch("images", queryset=Image.objects.only("id", "src", "alt"))).in_bulk(items)
+                is_lack = not items or any(product_id not in products or products[product_id].count < count
+                                           for product_id, count in items.items())
+                if is_lack:
+                    return Response(status=405)
+                new_order = Order()
+                if request.user.is_authenticated:
+                    user = request.user.profile
+                    new_order.fullName = user.fullName
+                    new_order.email = user.email
+                    new_order.phone = user.phone
+                new_order.save()
+                # Prices come from the catalog, not from the client
+                order_products = OrderProduct.objects.bulk_create([
+                    OrderProduct(product_id=product_id, count=count, price=products[product_id].price,
+                                 snapshot=product_snapshot(products[product_id]))
+                    for product_id, count in items.items()
+                ])
+                Order.products.through.objects.bulk_create([
+                    Order.products.through(order_id=new_order.pk, orderproduct_id=order_product.pk)
+                    for order_product in order_products
+                ])
             return Response({"orderId": new_order.id})
         except Exception:
             return Response(status=500)
 
     def list(self, request):
         try:
-            queryset = OrderHistory.objects.filter(user_id=request.user.id)
+            data = request.query_params
+            queryset = order_history_queryset(request.user.id)
+            if data.get("since"):
+                since = parse_datetime(data.get("since"))
+                if since is None:
+                    since_date = parse_date(data.get("since"))
+                    if since_date is None:
+                        return Response(status=400)
+                    since = datetime.datetime.combine(since_date, datetime.time.min)
+                if timezone.is_naive(since):
+                    since = timezone.make_aware(since)
+                queryset = queryset.filter(order__createdAt__gte=since)
+            if data.get("currentPage"):
+                paginator = Paginator(queryset, int(data.get("limit", 20)))
+                page = paginator.get_page(int(data.get("currentPage")))
+                serializer = OrderHistorySerializer(page.object_list, many=True)
+                return Response({"items": serializer.data, "currentPage": page.number,
+                                 "lastPage": paginator.num_pages})
             serializer = OrderHistorySerializer(queryset, many=True)
             return Response(serializer.data)
         except Exception:
@@ -413,15 +404,11 @@ class PaymentViewSet(viewsets.ViewSet):
                 data = request.data
                 if card_validate(**data):
                     queryset = Basket.objects.filter(user_id=request.user.id)
-                    for basket in queryset:
-                        product = basket.product
-                        if product.count - basket.count >= 0:
-                            product.count -= basket.count
-                            product.sold += basket.count
-                            product.save(update_fields=["count", "sold"])
-                            basket.delete()
-                        else:
-                            return Response(status=405)
+                    try:
+                        reserve_stock(dict(queryset.values_list("product_id", "count")))
+                    except OutOfStock as error:
+                        return Response({"shortages": error.shortages}, status=405)
+                    queryset.delete()
                     order = Order.objects.get(pk=pk)
                     order.status = "Paid"
                     history = OrderHistory.objects.create(user_id=request.user.id, order_id=order.id)
@@ -453,9 +440,9 @@ class ProfileViewSet(viewsets.ViewSet):
             profile.fullName = data.get('fullName')
             profile.email = data.get('email')
             profile.phone = data.get('phone')
-            if data.get('avatar'):
-                profile.avatar = Image.objects.get(src=data.get('avatar').get('src'))
-            else:
+            # Avatars are only set by AvatarViewSet. The form posts back the avatar it loaded, whose src processing
+            # may have replaced since and which dedupe shares between images, so it only tells to keep or drop it
+            if not data.get('avatar'):
                 profile.avatar = None
 
             profile.save()
@@ -483,34 +470,38 @@ class SetPasswordViewSet(viewsets.ViewSet):
 
 
 class AvatarViewSet(viewsets.ViewSet):
+    def initialize_request(self, request: HttpRequest, *args, **kwargs):
+        # Set before the body is parsed, the upload is size checked and hashed while it is received
+        request.upload_handlers = [AvatarUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     @action(detail=False, methods=['post'])
     def set_avatar(self, request: HttpRequest) -> Response:
         try:
-            data = request.data.get("avatar")
-            path = default_storage.save('avatars/{pk}/'.format(pk=request.user.pk) + data.name, data)
-            file_url = settings.MEDIA_URL + path
-            image = Image.objects.create(src=file_url, alt="avatar")
-            image.save()
-            profile = Profile.objects.get(user=request.user)
-            profile.avatar = image
-            profile.save()
-            serializer = ImageSerializer(image)
+            upload = request.data.get("avatar")
+            if request.upload_handlers[0].too_large:
+                return Response(status=413)
+            if upload is None:
+                return Response(status=400)
+            content_type = sniff_content_type(upload)
+            if content_type is None:
+                return Response(status=415)
+            avatar = save_avatar(request.user, upload, content_type)
+            if avatar.status == Avatar.PENDING:
+                transaction.on_commit(lambda: queue_avatar(avatar.pk))
+            serializer = AvatarImageSerializer(avatar.image)
             return Response(serializer.data)
         except Exception:
             return Response(status=500)
 
 
 class TagsViewSet(viewsets.ViewSet):
+    @cached_response("tags")
     def list(self, request: HttpRequest) -> Response:
         try:
             data = request.query_params
             if data.get("category"):
-                tags_queryset = Product.objects.filter(category_id=int(data.get("category"))).values_list('tags', flat=True)
-                tags = []
-                for tag_id in set(tags_queryset):
-                    tag = get_object_or_404(Tag, id=tag_id)
-                    if tag:
-                        tags.append(tag)
+                tags = Tag.objects.filter(tags__category_id=int(data.get("category"))).distinct().order_by("pk")
             else:
                 tags = Tag.objects.all()
             serializer = TagSerializer(tags, many=True)
@@ -519,49 +510,91 @@ class TagsViewSet(viewsets.ViewSet):
             return Response(status=500)
 
 
+class CatalogFacetsViewSet(viewsets.ViewSet):
+    @cached_response("facets")
+    def list(self, request: HttpRequest) -> Response:
+        try:
+            data = request.query_params
+            queryset = filter_catalog(Product.objects.all(), data)
+            if data.get("filter[name]"):
+                queryset = search_products(queryset, data.get("filter[name]"))
+            return Response(catalog_facets(queryset))
+        except Exception:
+            return Response(status=500)
+
+
 class ProductViewSet(viewsets.ViewSet):
     def retrieve(self, request, pk=None) -> Response:
         try:
-            item = get_object_or_404(Product, pk=pk)
-            serializer = ProductFullSerializer(item)
-            return Response(serializer.data)
+            # The version is read before the product, so a concurrent change can only make the ETag stale
+            version = peek_product_version(int(pk))
+            if version is None:
+                # Versions are only started for products that exist, ids made up by clients leave nothing behind
+                if not Product.objects.filter(pk=pk).exists():
+                    return Response(status=404)
+                version = get_product_version(int(pk))
+            etag = '"{}"'.format(version)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return self.patch_cache_headers(not_modified, etag)
+            item = get_object_or_404(product_full_queryset(), pk=pk)
+            return self.patch_cache_headers(Response(product_full_data(item)), etag)
         except Exception:
             return HttpResponse(status=500)
 
+    @staticmethod
+    def patch_cache_headers(response, etag: str):
+        response["ETag"] = etag
+        # Browsers revalidate every time, proxies and CDNs may reuse the page for a short while
+        patch_cache_control(response, public=True, max_age=0, s_maxage=settings.PRODUCT_CACHE_MAX_AGE)
+        patch_vary_headers(response, ["Accept"])
+        return response
+
 
 class ReviewViewSet(viewsets.ViewSet):
+    def list(self, request: HttpRequest, pk: int) -> Response:
+        try:
+            data = request.query_params
+            review_count = Product.objects.filter(pk=pk).values_list("review_count", flat=True).first()
+            if review_count is None:
+                return Response(status=404)
+            limit = min(int(data.get("limit", settings.REVIEWS_PER_PAGE)), settings.REVIEWS_MAX_PER_PAGE)
+            try:
+                items, next_cursor = keyset_page(Review.objects.filter(product=pk), "date", True,
+                                                 data.get("cursor"), limit)
+            except InvalidCursor:
+                return Response(status=400)
+            serializer = ReviewSerializer(items, many=True)
+            return Response({"items": serializer.data, "count": review_count, "nextCursor": next_cursor})
+        except Exception:
+            return Response(status=500)
+
     @action(detail=True, methods=["post"])
     def add_review(self, request: HttpRequest, pk: int) -> Response:
         try:
             data = request.data
-            product = Product.objects.get(pk=pk)
-            new_review = Review.objects.create(author=data.get("author"),
-                                               email=data.get("email"),
-                                               text=data.get("text"),
-                                               rate=int(data.get("rate")))
-
-            product.reviews.add(new_review)
-            all_ratings = product.reviews.values_list('rate', flat=True)
-            updated_rating = round(sum(all_ratings) / all_ratings.count(), 1)
-            if updated_rating > 5:
-                updated_rating = 5
-            product.rating = updated_rating
-
-            rating_specification = product.specifications.filter(name="Rating").first()
-            if rating_specification:
-                rating_specification.value = product.rating
-                rating_specification.save()
-            else:
-                new_rating_specification = Specification.objects.create(
-                    name="Рейтинг",
-                    value=product.rating
-                )
-                product.specifications.add(new_rating_specification)
-            new_review.save()
-            product.save()
-            queryset = product.reviews
-
-            serializer = ReviewSerializer(queryset, many=True)
-            return Response(serializer.data)
+            with transaction.atomic():
+                product = Product.objects.get(pk=pk)
+                # review_count, rating_sum and rating are updated by the post_save handler
+                new_review = Review.objects.create(product=product,
+                                                   author=data.get("author"),
+                                                   email=data.get("email"),
+                                                   text=data.get("text"),
+                                                   rate=int(data.get("rate")))
+                product.refresh_from_db(fields=["rating", "review_count"])
+
+                rating_specification = product.specifications.filter(name="Rating").first()
+                if rating_specification:
+                    rating_specification.value = product.rating
+                    rating_specification.save()
+                else:
+                    Specification.objects.create(
+                        product=product,
+                        name="Рейтинг",
+                        value=product.rating
+                    )
+            serializer = ReviewSerializer(new_review)
+            return Response({"review": serializer.data, "reviewsCount": product.review_count,
+                             "rating": product.rating})
         except Exception:
             return Response(status=500)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 import sys
 from pathlib import Path
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -40,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'frontend',
     'rest_framework',
+    'django_celery_beat',
     'api_app.apps.ApiAppConfig',
     'auth_app.apps.AuthAppConfig',
 ]
@@ -54,7 +56,6 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     # 'request_logging.middleware.LoggingMiddleware',
-    'api_app.middleware.SaleMiddleware'
 ]
 
 ROOT_URLCONF = 'megano.urls'
@@ -99,6 +100,51 @@ DATABASES = {
 
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared between worker processes so that version bumps are seen by all of them
+    'storefront': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'TIMEOUT': 60 * 60,
+        # Every set culls a third of the files at random once there are more than MAX_ENTRIES,
+        # room is left for all the endpoint and query string combinations the storefront serves
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    # Storefront and product versions (one key per viewed product, expired after PRODUCT_VERSION_TIMEOUT),
+    # too few to ever be culled
+    'storefront_versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'versions',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10 ** 7},
+    },
+}
+if 'test' in sys.argv:
+    CACHES['storefront'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    CACHES['storefront_versions'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+
+# Cache alias used for the responses of read-mostly storefront endpoints
+STOREFRONT_CACHE = 'storefront'
+STOREFRONT_VERSION_CACHE = 'storefront_versions'
+# Hit/miss counters are written by one request in this many, each write counting for all of them
+STOREFRONT_STATS_SAMPLE_RATE = 100
+
+# The JSON renderer and parser use orjson when it is installed and the stdlib otherwise
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api_app.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -173,6 +219,29 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    # Sales start and end on date boundaries, checking every hour is enough
+    'apply-sales': {
+        'task': 'api_app.tasks.apply_sales_task',
+        'schedule': crontab(minute=0),
+    },
+    # Each run only reads the orders paid since the previous one
+    'refresh-popularity': {
+        'task': 'api_app.tasks.refresh_popularity_task',
+        'schedule': crontab(minute='*/15'),
+    },
+    # Sends again the processing of avatars whose task was never sent or got lost
+    'requeue-avatars': {
+        'task': 'api_app.tasks.requeue_avatars_task',
+        'schedule': crontab(minute='*/10'),
+    },
+    # Avatars are collected on upload too, this catches the ones dropped from profiles otherwise
+    'collect-avatars': {
+        'task': 'api_app.tasks.collect_avatars_task',
+        'schedule': crontab(hour=3, minute=30),
+    },
+}
 
 
 
@@ -182,3 +251,32 @@ DELETE_ARCHIVED_DATA = False
 #Через сколько дней будет удалена запись о истёкшей скидке
 DAYS_TO_DELETE = 7
 SALES_PER_PAGE = 8
+#Границы ценовых диапазонов в фильтре каталога
+CATALOG_PRICE_BUCKETS = [0, 1000, 5000, 10000, 50000]
+#Сколько секунд прокси и CDN могут отдавать страницу товара без перепроверки
+PRODUCT_CACHE_MAX_AGE = 60
+#Через сколько секунд версия (ETag) товара забывается, если он не менялся, после этого начинается новая
+PRODUCT_VERSION_TIMEOUT = 7 * 24 * 60 * 60
+#Сколько последних отзывов показывать на странице товара
+PRODUCT_LATEST_REVIEWS = 5
+#Размер страницы отзывов по умолчанию и наибольший допустимый
+REVIEWS_PER_PAGE = 10
+REVIEWS_MAX_PER_PAGE = 50
+#Сколько лимитированных товаров отдавать по умолчанию и наибольший допустимый размер страницы
+LIMITED_PRODUCTS_PER_PAGE = 8
+LIMITED_PRODUCTS_MAX = 50
+#Окна рейтинга популярности: название и длина в днях, вклад продажи уменьшается вдвое за половину окна
+POPULARITY_WINDOWS = {"week": 7, "month": 30}
+#Окно, по которому сортируются популярные товары, если в запросе не указан window
+POPULARITY_WINDOW = "week"
+#Сколько секунд после создания запись истории заказов может оставаться незафиксированной, этот промежуток перечитывается
+POPULARITY_COMMIT_LAG = 600
+#Наибольший размер загружаемого аватара в байтах и допустимые форматы с расширениями файлов
+AVATAR_MAX_SIZE = 5 * 1024 * 1024
+AVATAR_CONTENT_TYPES = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+#Изображения с большим числом пикселей не обрабатываются
+AVATAR_MAX_PIXELS = 40_000_000
+#Стороны квадратных миниатюр аватара в пикселях, самая большая JPEG миниатюра показывается в профиле
+AVATAR_SIZES = [64, 128, 256]
+#Через сколько секунд необработанный аватар снова отправляется на обработку
+AVATAR_PENDING_TIMEOUT = 600